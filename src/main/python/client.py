@@ -0,0 +1,81 @@
+""" Client of the local planning service (see server.py) """
+import argparse
+import http.client
+import json
+import socket
+
+
+# Errors re-raised on the client side (by the name reported by the service)
+ERROR_TYPES = {"KeyError": KeyError, "ValueError": ValueError,
+               "TypeError": TypeError, "RuntimeError": RuntimeError}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix domain socket """
+    def __init__(self, unix_path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = unix_path      # Path of the socket the service listens on
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class PlanningClient:
+    """ Class that sends path queries to a running planning service """
+    def __init__(self,
+                 host:      str = "127.0.0.1",
+                 port:      int = 8765,
+                 unix_path: str = None,
+                 timeout:   float = None):
+        self.host      = host           # Address of the service (TCP)
+        self.port      = port           # Port of the service (TCP)
+        self.unix_path = unix_path      # Unix socket of the service (used instead of TCP if given)
+        self.timeout   = timeout        # Timeout of each request (in seconds)
+
+    def _request(self, method: str, target: str, payload: dict = None) -> dict:
+        """ Sends a request and returns the decoded JSON answer (raising the error reported by the service) """
+        if self.unix_path is not None:
+            connection = UnixHTTPConnection(self.unix_path, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            connection.request(method, target, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            answer = json.loads(response.read())
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise ERROR_TYPES.get(answer.get("type"), RuntimeError)(answer.get("error"))
+        return answer
+
+    def health(self) -> dict:
+        """ Returns the status of the service (warm scenarios and graphs) """
+        return self._request("GET", "/health")
+
+    def plan(self, scenario: str, tolerance: float, heuristic: str = "h2", pois: list = None) -> dict:
+        """ Requests the solution plan of a scenario (optionally overriding its POIs) """
+        payload = {"scenario": scenario, "tolerance": tolerance, "heuristic": heuristic}
+        if pois is not None:
+            payload["POIs"] = [list(map(float, poi)) for poi in pois]
+        return self._request("POST", "/plan", payload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Client of the local radar path planning service")
+    parser.add_argument("scenario", help="Name of the scenario")
+    parser.add_argument("tolerance", type=float, help="Maximum detection level allowed")
+    parser.add_argument("--heuristic", default="h2", choices=["h1", "h2"], help="Heuristic of the search")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the service")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port of the service")
+    parser.add_argument("--unix", default=None, help="Unix socket of the service (instead of TCP)")
+    arguments = parser.parse_args()
+
+    client = PlanningClient(host=arguments.host, port=arguments.port, unix_path=arguments.unix)
+    result = client.plan(arguments.scenario, arguments.tolerance, heuristic=arguments.heuristic)
+    print(f"Total path cost: {result['path_cost']}")
+    print(f"Number of expanded nodes: {result['nodes_expanded']}")
@@ -0,0 +1,117 @@
+import numpy as np
+
+from .LRUCache import LRUCache
+from .Map import EPSILON
+
+
+class DetectionEpochs:
+    """
+    Class that models a time-indexed detection field: one detection map (layer) per epoch. Layers
+    are computed on demand from the contributions of the radars active at each epoch, and kept
+    in a bounded cache (epochs with the same active radars and headings share their layer)
+    """
+    def __init__(self,
+                 radar_map,
+                 times:            np.array,
+                 cache_size:       int = 16,
+                 patch_cache_size: int = 256):
+        self.radar_map = radar_map                          # Map whose radars are scheduled
+        self.times     = np.asarray(times, dtype=np.float64) # Time of each epoch (in seconds)
+        self.layers    = LRUCache(cache_size)               # Activity signature -> detection map of the epoch
+        self.patches   = LRUCache(patch_cache_size)         # Radar index -> contribution of the radar
+
+        self.lat_points = np.linspace(radar_map.boundaries.min_lat, radar_map.boundaries.max_lat, radar_map.height)
+        self.lon_points = np.linspace(radar_map.boundaries.min_lon, radar_map.boundaries.max_lon, radar_map.width)
+        self.cos_lat_points = np.cos(np.radians(self.lat_points))
+
+        self.schedules    = dict(radar_map.radars.schedules)   # Schedules (frozen when the field is created)
+        self.static_field = None                                # Contribution of the always-on static radars
+        self.bounds       = None                                # (min, max) used to scale every layer
+
+    def _compute_patch(self, index: int) -> tuple:
+        """ Computes the contribution of a radar inside the window covered by its range """
+        radar = self.radar_map.radars[index]
+        rows, cols = radar.compute_detection_window(self.lat_points, self.lon_points,
+                                                    self.radar_map.distance_mode, self.cos_lat_points)
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            return rows, cols, None, None
+
+        field = radar.compute_detection_field(self.lat_points[rows], self.lon_points[cols],
+                                              self.radar_map.distance_mode, self.cos_lat_points[rows])
+
+        # Bearing of every cell of the window (only needed by rotating radars)
+        bearings = None
+        if index in self.schedules and self.schedules[index].rotates:
+            d_lat = (self.lat_points[rows] - radar.location.latitude)[:, np.newaxis]
+            d_lon = (self.lon_points[cols] - radar.location.longitude)[np.newaxis, :]
+            bearings = np.arctan2(d_lon * np.cos(np.radians(radar.location.latitude)), d_lat)
+
+        return rows, cols, field, bearings
+
+    def _patch(self, index: int) -> tuple:
+        """ Returns the (cached) contribution of a scheduled radar """
+        patch = self.patches.get(index)
+        if patch is None:
+            patch = self._compute_patch(index)
+            self.patches.put(index, patch)
+        return patch
+
+    def _prepare(self) -> None:
+        """ Computes the field of the static radars and the scale shared by every layer """
+        self.static_field = np.zeros((self.radar_map.height, self.radar_map.width))
+        for index in range(len(self.radar_map.radars)):
+            if index not in self.schedules:
+                rows, cols, field, _ = self._compute_patch(index)
+                if field is not None:
+                    np.maximum(self.static_field[rows, cols], field, out=self.static_field[rows, cols])
+
+        # Scale of the map with every radar switched on (same as Map.compute_detection_map)
+        full_field = self.static_field.copy()
+        for index in self.schedules:
+            rows, cols, field, _ = self._patch(index)
+            if field is not None:
+                np.maximum(full_field[rows, cols], field, out=full_field[rows, cols])
+        self.bounds = (np.min(full_field), np.max(full_field))
+
+    def signature(self, time: np.float32) -> tuple:
+        """ Returns the scheduled radars active at the given time, with the heading of their beams """
+        return tuple((index, schedule.heading(time))
+                     for index, schedule in sorted(self.schedules.items()) if schedule.is_active(time))
+
+    def layer_at(self, time: np.float32) -> np.array:
+        """ Returns the detection map at the given time """
+        key = self.signature(time)
+        layer = self.layers.get(key)
+        if layer is not None:
+            return layer
+
+        if self.static_field is None:
+            self._prepare()
+
+        # Add the contributions of the active scheduled radars to the static field
+        layer = self.static_field.copy()
+        for index, heading in key:
+            rows, cols, field, bearings = self._patch(index)
+            if field is None:
+                continue
+            if heading is not None:
+                field = np.where(self.schedules[index].beam_mask(bearings, heading), field, 0.0)
+            np.maximum(layer[rows, cols], field, out=layer[rows, cols])
+
+        # Scale with epsilon
+        min_val, max_val = self.bounds
+        if max_val > min_val:
+            layer = ((layer - min_val) / (max_val - min_val)) * (1 - EPSILON) + EPSILON
+        else:
+            layer = np.full_like(layer, EPSILON)
+
+        layer = layer.astype(np.float32)
+        self.layers.put(key, layer)
+        return layer
+
+    def __getitem__(self, epoch: int) -> np.array:
+        """ Returns the detection map of an epoch (by index) """
+        return self.layer_at(self.times[epoch])
+
+    def __len__(self) -> int:
+        return len(self.times)
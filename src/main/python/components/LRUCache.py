@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Class that models a thread-safe cache bounded by a maximum number of (least recently used) entries """
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("Cache capacity must be at least 1")
+
+        self.capacity = capacity            # Maximum number of entries kept in memory
+        self.entries  = OrderedDict()       # Cached entries (ordered from least to most recently used)
+        self.lock     = threading.Lock()    # Guards the entries when accessed from several threads
+
+    def get(self, key, default=None):
+        """ Returns the entry stored under the key (marking it as recently used) or the default value """
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value) -> None:
+        """ Stores an entry, evicting the least recently used ones when the capacity is exceeded """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def keys(self) -> list:
+        """ Returns the cached keys (from least to most recently used) """
+        with self.lock:
+            return list(self.entries.keys())
+
+    def clear(self) -> None:
+        """ Removes every entry of the cache """
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
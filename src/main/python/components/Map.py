@@ -5,9 +5,9 @@ import pickle
 import hashlib
 from datetime import datetime
 
-from .Location import Location
 from .Boundaries import Boundaries
-from .Radar import Radar
+from .Radar import DISTANCE_MODES
+from .RadarFleet import RadarFleet
 
 
 # Constant that avoids setting cells to have an associated cost of zero
@@ -19,51 +19,88 @@ class Map:
                  boundaries: Boundaries,
                  height:     np.int32,
                  width:      np.int32,
-                 radars:     np.array=None):
-        self.boundaries = boundaries        # Boundaries of the map
-        self.height     = height            # Number of coordinates in the y-axis
-        self.width      = width             # Number of coordinates int the x-axis
-        self.radars     = radars            # List containing the radars (objects)
+                 radars:     RadarFleet=None,
+                 distance_mode: str = "euclidean"):
+        self.boundaries       = boundaries      # Boundaries of the map
+        self.height           = height          # Number of coordinates in the y-axis
+        self.width            = width           # Number of coordinates int the x-axis
+        self.radars           = radars          # Radars of the map (stored column-wise)
+        self.distance_mode    = distance_mode   # Distance used to gate the radars' range (see DISTANCE_MODES)
+        self.detection_bounds = None            # (Cache key, min, max) unscaled detection levels of the whole map
+
+        if distance_mode not in DISTANCE_MODES:
+            raise ValueError(f"Distance mode must be one of {', '.join(DISTANCE_MODES)}")
+
+        # Lists of Radar objects are converted into the columnar representation
+        if radars is not None and not isinstance(radars, RadarFleet):
+            self.radars = RadarFleet.from_radars(radars)
 
         # Setup cache directory
         self.cache_dir = os.path.join(os.path.dirname(__file__), 'map_cache')
         os.makedirs(self.cache_dir, exist_ok=True)
 
-    def generate_radars(self, n_radars: np.int32) -> None:
-        """ Generates n-radars randomly and inserts them into the radars list """
-        # Select random coordinates inside the boundaries of the map
-        lat_range = np.linspace(start=self.boundaries.min_lat,
-                                stop=self.boundaries.max_lat, num=self.height)
-        lon_range = np.linspace(start=self.boundaries.min_lon,
-                                stop=self.boundaries.max_lon, num=self.width)
-        rand_lats = np.random.choice(a=lat_range, size=n_radars, replace=False)
-        rand_lons = np.random.choice(a=lon_range, size=n_radars, replace=False)
-        self.radars = []        # Initialize 'radars' as an empty list
-
-        # Loop for each radar that must be generated
-        for i in range(n_radars):
-            # Create a new radar
-            new_radar = Radar(location=Location(latitude=rand_lats[i], longitude=rand_lons[i]),
-                              transmission_power=np.random.uniform(low=1, high=1000000),
-                              antenna_gain=np.random.uniform(low=10, high=50),
-                              wavelength=np.random.uniform(low=0.001, high=10.0),
-                              cross_section=np.random.uniform(low=0.1, high=10.0),
-                              minimum_signal=np.random.uniform(low=1e-10, high=1e-15),
-                              total_loss=np.random.randint(low=1, high=10),
-                              covariance=None)
-
-            # Insert the new radar
-            self.radars.append(new_radar)
+    def generate_radars(self, n_radars: np.int32, seed=None) -> None:
+        """
+        Generates n-radars randomly and stores them in the map. With a seed (an integer or a numpy
+        Generator) all their parameters are drawn at once. Without it they are drawn from the global
+        numpy generator as they always were, so that 'np.random.seed' keeps the radars of the
+        existing scenarios; fleets larger than the rows or columns of the map (which that could not
+        place) are drawn at once from a seed taken from the global generator
+        """
+        if seed is None:
+            if n_radars <= min(self.height, self.width):
+                self.radars = RadarFleet.generate_legacy(boundaries=self.boundaries,
+                                                         height=self.height,
+                                                         width=self.width,
+                                                         n_radars=n_radars)
+                return
+            seed = np.random.randint(low=0, high=2**31 - 1)
+
+        self.radars = RadarFleet.generate(boundaries=self.boundaries,
+                                          height=self.height,
+                                          width=self.width,
+                                          n_radars=n_radars,
+                                          rng=np.random.default_rng(seed))
+
+    def load_radars(self, path: str, validate: bool = True, seed=None) -> None:
+        """
+        Loads a radar inventory (.npz archive, memory mapped when uncompressed, or .csv file parsed
+        in chunks) and stores it in the map; the seed is used for missing covariance matrices
+        """
+        if path.endswith(".npz"):
+            radars = RadarFleet.load_npz(path, seed=seed)
+        elif path.endswith(".csv"):
+            radars = RadarFleet.read_csv(path, seed=seed)
+        else:
+            raise ValueError(f"Unsupported radar inventory format: {path}")
+
+        if validate:
+            radars.validate(boundaries=self.boundaries)
+        self.radars = radars
+
+    def save_radars(self, path: str) -> None:
+        """ Stores the radars of the map as an inventory (.npz archive or .csv file) """
+        if path.endswith(".npz"):
+            self.radars.save_npz(path)
+        elif path.endswith(".csv"):
+            self.radars.write_csv(path)
+        else:
+            raise ValueError(f"Unsupported radar inventory format: {path}")
 
     def get_radars_locations_numpy(self) -> np.array:
         """ Returns an array with the coordiantes (lat, lon) of each radar registered in the map """
-        locations = np.zeros(shape=(len(self.radars), 2), dtype=np.float32)
-        for i in range(len(self.radars)):
-            locations[i] = self.radars[i].location.to_numpy()
-        return locations
+        return self.radars.get_locations_numpy()
+
+    def compute_detection_map(self, use_cache: bool = True, regions: list = None) -> np.array:
+        """
+        Computes or loads detection map with caching support (the cache is neither read nor written
+        if use_cache is False). If regions (list of row and column ranges: (row_start, row_stop,
+        col_start, col_stop)) are given, only their cells are computed and the rest of the map is set
+        to infinity (never below the tolerance); these partial maps are never cached
+        """
+        if regions is not None:
+            return self._compute_region_detection_map(regions)
 
-    def compute_detection_map(self, use_cache: bool = True) -> np.array:
-        """ Computes or loads detection map with caching support """
         # Generate unique cache key based on map parameters
         cache_key = self._generate_cache_key()
         cache_file = os.path.join(self.cache_dir, f"{cache_key}.pkl")
@@ -80,6 +117,8 @@ class Map:
         # Compute fresh if no cache exists or loading failed
         print("Computing new detection map...")
         detection_map = self._compute_fresh_detection_map()
+        if not use_cache:
+            return detection_map
 
         # Save to cache
         try:
@@ -93,31 +132,86 @@ class Map:
 
     def _compute_fresh_detection_map(self) -> np.array:
         """ Actual computation without caching """
+        detection_map = self._compute_raw_detection_map()
+
+        # The scale of the whole map is kept for the maps restricted to some regions
+        self.detection_bounds = (self._generate_cache_key(), np.min(detection_map), np.max(detection_map))
+        return self._scale_detection_map(detection_map, self.detection_bounds[1:])
+
+    def _compute_region_detection_map(self, regions: list) -> np.array:
+        """
+        Computation restricted to some regions of the map (without caching). Values are scaled
+        with the real bounds of the whole map so that they match it; these are computed in a
+        single pass the first time and kept until the map changes
+        """
+        detection_map = self._compute_raw_detection_map(regions)
+        detection_map = self._scale_detection_map(detection_map, self._full_detection_bounds())
+
+        inside = np.zeros((self.height, self.width), dtype=bool)
+        for row_start, row_stop, col_start, col_stop in regions:
+            inside[row_start:row_stop, col_start:col_stop] = True
+        detection_map[~inside] = np.inf
+        return detection_map
+
+    def _compute_raw_detection_map(self, regions: list = None) -> np.array:
+        """
+        Computes the (unscaled) detection level of every cell, or only of the cells inside the
+        regions (row_start, row_stop, col_start, col_stop) if they are given
+        """
         lat_points = np.linspace(self.boundaries.min_lat, self.boundaries.max_lat, self.height)
         lon_points = np.linspace(self.boundaries.min_lon, self.boundaries.max_lon, self.width)
 
+        # Cosine of the latitude of every row (shared by all the radars)
+        cos_lat_points = np.cos(np.radians(lat_points))
+
+        if regions is None:
+            regions = [(0, self.height, 0, self.width)]
+            description = "Computing detection map"
+        else:
+            description = "Computing detection map (regions)"
+
         detection_map = np.zeros((self.height, self.width), dtype=np.float32)
 
-        for i in tqdm(range(self.height), desc="Computing detection map"):
-            for j in range(self.width):
-                max_possibility = 0.0
-                for radar in self.radars:
-                    possibility = radar.compute_detection_level(lat_points[i], lon_points[j])
-                    if possibility > max_possibility:
-                        max_possibility = possibility
+        # Each radar only updates the cells of its window (that fall inside the regions)
+        for radar in tqdm(self.radars, total=len(self.radars), desc=description):
+            window_rows, window_cols = radar.compute_detection_window(lat_points, lon_points,
+                                                                      self.distance_mode, cos_lat_points)
+            for row_start, row_stop, col_start, col_stop in regions:
+                rows = slice(max(window_rows.start, row_start), min(window_rows.stop, row_stop))
+                cols = slice(max(window_cols.start, col_start), min(window_cols.stop, col_stop))
+                if rows.start >= rows.stop or cols.start >= cols.stop:
+                    continue
 
-                detection_map[i, j] = max_possibility
+                field = radar.compute_detection_field(lat_points[rows], lon_points[cols],
+                                                      self.distance_mode, cos_lat_points[rows])
+                np.maximum(detection_map[rows, cols], field, out=detection_map[rows, cols], casting='unsafe')
 
-        # Scale with epsilon
-        min_val = np.min(detection_map)
-        max_val = np.max(detection_map)
+        return detection_map
+
+    def _full_detection_bounds(self) -> tuple:
+        """ Returns the (min, max) unscaled detection levels of the whole map (computed once per map) """
+        cache_key = self._generate_cache_key()
+        if self.detection_bounds is None or self.detection_bounds[0] != cache_key:
+            detection_map = self._compute_raw_detection_map()
+            self.detection_bounds = (cache_key, np.min(detection_map), np.max(detection_map))
+        return self.detection_bounds[1:]
 
+    @staticmethod
+    def _scale_detection_map(detection_map: np.array, bounds: tuple) -> np.array:
+        """ Scales the detection levels between epsilon and 1 """
+        min_val, max_val = bounds
         if max_val > min_val:
-            detection_map = ((detection_map - min_val) / (max_val - min_val)) * (1 - EPSILON) + EPSILON
-        else:
-            detection_map = np.full_like(detection_map, EPSILON)
+            return ((detection_map - min_val) / (max_val - min_val)) * (1 - EPSILON) + EPSILON
+        return np.full_like(detection_map, EPSILON)
 
-        return detection_map
+    def compute_detection_epochs(self, times: np.array, cache_size: int = 16):
+        """
+        Returns the time-indexed detection field of the map (one detection map per epoch time,
+        computed on demand and kept in a cache bounded to 'cache_size' layers)
+        """
+        # Imported here as the epochs depend on this module
+        from .DetectionEpochs import DetectionEpochs
+        return DetectionEpochs(radar_map=self, times=times, cache_size=cache_size)
 
     def _generate_cache_key(self) -> str:
         """ Generates unique hash key for current map configuration """
@@ -125,14 +219,18 @@ class Map:
             'boundaries': (self.boundaries.min_lat, self.boundaries.max_lat,
                            self.boundaries.min_lon, self.boundaries.max_lon),
             'dimensions': (self.height, self.width),
-            'radars': [(r.location.latitude, r.location.longitude) for r in self.radars],
-            'params': [(r.transmission_power, r.antenna_gain, r.wavelength,
-                        r.cross_section, r.minimum_signal, r.total_loss) for r in self.radars]
+            'distance_mode': self.distance_mode,
         }
 
-        # Create consistent string representation
-        hash_str = str(hash_data).encode('utf-8')
-        return hashlib.md5(hash_str).hexdigest()
+        # Create consistent representation (radar parameters hashed as raw arrays)
+        md5 = hashlib.md5(str(hash_data).encode('utf-8'))
+        for values in (self.radars.latitudes, self.radars.longitudes,
+                       self.radars.transmission_power, self.radars.antenna_gain,
+                       self.radars.wavelength, self.radars.cross_section,
+                       self.radars.minimum_signal, self.radars.total_loss,
+                       self.radars.covariance):
+            md5.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        return md5.hexdigest()
 
     def clear_cache(self, older_than_days: int = None):
         """ Clears cache, optionally removing files older than specified days """
@@ -0,0 +1,93 @@
+import numpy as np
+
+from .Boundaries import Boundaries
+from .SearchEngine import discretize_coords
+
+
+class UnionFind:
+    """ Class that models a disjoint-set forest (union by size, path halving) over integer elements """
+    def __init__(self, n_elements: int):
+        self.parent = list(range(n_elements))   # Parent of each element (roots are their own parent)
+        self.size   = [1] * n_elements          # Size of the set of each root
+
+    def find(self, element: int) -> int:
+        """ Returns the root of the set containing the element """
+        parent = self.parent
+        while parent[element] != element:
+            parent[element] = parent[parent[element]]
+            element = parent[element]
+        return element
+
+    def union(self, first: int, second: int) -> None:
+        """ Merges the sets containing both elements """
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+
+
+def find_minimum_tolerance(detection_map: np.array,
+                           locations: np.array,
+                           boundaries: Boundaries,
+                           map_width: np.int32,
+                           map_height: np.int32,
+                           initial_location_index: np.int32 = 0) -> np.float32:
+    """
+    Computes the smallest tolerance at which every pair of consecutive POIs is connected, in a
+    single pass: cells are added from the least to the most detected one to a union-find
+    structure until all the pairs share a set. Returns infinity if no tolerance connects them.
+    The connected areas are the same with 4 or 8 neighbours (diagonal edges never cut corners).
+    Note that build_graph only accepts tolerances greater than 1e-4
+    """
+    height, width = detection_map.shape
+    cells = [int(y) * width + int(x) for y, x in discretize_coords(locations, boundaries, map_width, map_height)]
+    if len(cells) <= 1:
+        raise ValueError("At least 2 POIs required for pathfinding")
+    pairs = [(cells[i], cells[i + 1]) for i in range(initial_location_index, len(cells) - 1)]
+
+    levels = detection_map.ravel()
+    added = np.zeros(levels.size, dtype=bool)
+    sets = UnionFind(levels.size)
+    connected = 0       # Number of leading pairs already connected
+
+    for cell in np.argsort(levels, kind='stable').tolist():
+        added[cell] = True
+        y, x = divmod(cell, width)
+
+        # Merge the cell with its already added neighbours
+        if y > 0 and added[cell - width]:
+            sets.union(cell, cell - width)
+        if y < height - 1 and added[cell + width]:
+            sets.union(cell, cell + width)
+        if x > 0 and added[cell - 1]:
+            sets.union(cell, cell - 1)
+        if x < width - 1 and added[cell + 1]:
+            sets.union(cell, cell + 1)
+
+        # All pairs connected: the level of the last cell added is the tolerance needed
+        while connected < len(pairs):
+            start, end = pairs[connected]
+            if not (added[start] and added[end] and sets.find(start) == sets.find(end)):
+                break
+            connected += 1
+        if connected == len(pairs):
+            return levels[cell]
+
+    return np.inf
+
+def tolerance_coverage(detection_map: np.array, tolerances: np.array) -> np.array:
+    """ Computes the fraction of passable cells (detection level below the tolerance) for each tolerance """
+    levels = np.sort(detection_map, axis=None)
+    passable = np.searchsorted(levels, np.asarray(tolerances), side='right')
+    return passable / levels.size
+
+def round_up_tolerance(tolerance: np.float32, decimals: int = 6) -> np.float32:
+    """
+    Rounds a tolerance up to the given number of decimals (so that the printed value still
+    connects the POIs), keeping it above the lower limit accepted by build_graph (1e-4)
+    """
+    scale = 10 ** decimals
+    return max(np.ceil(tolerance * scale) / scale, (np.floor(1e-4 * scale) + 1) / scale)
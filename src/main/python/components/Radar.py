@@ -1,7 +1,20 @@
 import numpy as np
 from .Location import Location
+from .RadarSchedule import RadarSchedule
 
 
+# Meters per degree used by the (flat) Euclidean approximation of the distance
+METERS_PER_DEGREE = 111000
+
+# Mean radius of the Earth (in meters) used by the geodesic distances
+EARTH_RADIUS = 6371000
+
+# Ways of measuring the distance from a radar to a point:
+#  - euclidean:       Euclidean distance in degrees times 111000 (fast, distorted away from the equator)
+#  - equirectangular: local equirectangular projection (longitudes scaled by the cosine of the mean latitude)
+#  - haversine:       great-circle distance
+DISTANCE_MODES = ("euclidean", "equirectangular", "haversine")
+
 class Radar:
     """ Class that models the Radar """
     def __init__(self,
@@ -12,7 +25,8 @@ class Radar:
                  cross_section:      np.float32,
                  minimum_signal:     np.float32,
                  total_loss:         np.float32,
-                 covariance:         np.array):
+                 covariance:         np.array,
+                 schedule:           RadarSchedule = None):
         self.location           = location              # Location of the radar (geodetic coordinates)
         self.transmission_power = transmission_power    # Transmission power (in Watts [W])
         self.antenna_gain       = antenna_gain          # Antenna gain (no units)
@@ -20,9 +34,10 @@ class Radar:
         self.cross_section      = cross_section         # Cross-section of the antenna (in squared meters)
         self.minimum_signal     = minimum_signal        # Sensitivity of the radar (in Watts [W])
         self.total_loss         = total_loss            # Loss of the radar (no units, discrete)
+        self.schedule           = schedule              # Activity schedule of the radar (None = always on, static)
 
         # If the covariance matrix is NOT provided, then compute it
-        if not covariance:
+        if covariance is None:
             self.covariance = self.get_covariance_matrix()
         else:
             self.covariance = covariance
@@ -39,15 +54,36 @@ class Radar:
         B = ((4.0 * np.pi) ** 3) * self.minimum_signal * self.total_loss
         return (A / B) ** (1  / 4)
 
-    def compute_detection_level(self, latitude: np.float32, longitude: np.float32) -> np.float32:
+    def compute_distance(self, latitude: np.float32, longitude: np.float32,
+                         distance_mode: str = "euclidean") -> np.float32:
+        """ Computes the distance (in meters) from the radar to a point """
+        if distance_mode == "euclidean":
+            return np.sqrt( (latitude - self.location.latitude) ** 2 + \
+                            (longitude - self.location.longitude) ** 2 ) * METERS_PER_DEGREE
+
+        d_lat = np.radians(latitude - self.location.latitude)
+        d_lon = np.radians(longitude - self.location.longitude)
+
+        if distance_mode == "equirectangular":
+            mean_lat = np.radians((latitude + self.location.latitude) / 2.0)
+            return EARTH_RADIUS * np.sqrt(d_lat ** 2 + (d_lon * np.cos(mean_lat)) ** 2)
+
+        if distance_mode == "haversine":
+            a = np.sin(d_lat / 2.0) ** 2 + \
+                np.cos(np.radians(latitude)) * np.cos(np.radians(self.location.latitude)) * np.sin(d_lon / 2.0) ** 2
+            return 2.0 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        raise ValueError(f"Distance mode must be one of {', '.join(DISTANCE_MODES)}")
+
+    def compute_detection_level(self, latitude: np.float32, longitude: np.float32,
+                                distance_mode: str = "euclidean") -> np.float32:
         """ Computes the detection level of a given radar in a particular point in space """
         # Compute the radar's max range
         max_range = self.compute_max_range()
 
-        # Compute an approximation of the distance (in meters) from the radar to the point
-        distance = np.sqrt( (latitude - self.location.latitude) ** 2 + \
-                            (longitude - self.location.longitude) ** 2 ) * 111000
-        
+        # Compute the distance (in meters) from the radar to the point
+        distance = self.compute_distance(latitude, longitude, distance_mode)
+
         # If the distance is inside the detection range, proceed
         if distance <= max_range:
             # Compute a 2D-multivariate gaussian that models the attenuation of the radar's detections
@@ -61,3 +97,89 @@ class Radar:
         # If not, return 0
         else:
             return 0.0
+
+    def compute_detection_window(self, lat_points: np.array, lon_points: np.array,
+                                 distance_mode: str = "euclidean", cos_lat_points: np.array = None) -> tuple:
+        """
+        Returns the (rows, columns) slices of the grid that can be inside the radar's range, so that
+        the detection field only has to be computed there (the points must be sorted increasingly)
+        """
+        max_range = self.compute_max_range()
+        latitude, longitude = self.location.latitude, self.location.longitude
+
+        if distance_mode == "euclidean":
+            lat_reach = lon_reach = max_range / METERS_PER_DEGREE
+        elif distance_mode in ("equirectangular", "haversine"):
+            # No point farther (in latitude) than the range can be inside it
+            lat_reach = np.degrees(min(max_range / EARTH_RADIUS, np.pi))
+            lon_reach = 360.0
+        else:
+            raise ValueError(f"Distance mode must be one of {', '.join(DISTANCE_MODES)}")
+
+        rows = slice(int(np.searchsorted(lat_points, latitude - lat_reach, side='left')),
+                     int(np.searchsorted(lat_points, latitude + lat_reach, side='right')))
+
+        if distance_mode != "euclidean" and rows.start < rows.stop:
+            # Bound the longitudes with the smallest cosine of the rows in range
+            if cos_lat_points is None:
+                cos_lat_points = np.cos(np.radians(lat_points))
+            if distance_mode == "equirectangular":
+                min_cos = np.min(np.cos(np.radians((np.asarray(lat_points[rows]) + latitude) / 2.0)))
+                if min_cos > 0:
+                    lon_reach = np.degrees(max_range / EARTH_RADIUS / min_cos)
+            else:
+                min_cos = np.min(cos_lat_points[rows]) * np.cos(np.radians(latitude))
+                max_a = np.sin(min(max_range / EARTH_RADIUS, np.pi) / 2.0) ** 2
+                if min_cos > 0 and max_a / min_cos < 1.0:
+                    lon_reach = np.degrees(2.0 * np.arcsin(np.sqrt(max_a / min_cos)))
+
+        cols = slice(int(np.searchsorted(lon_points, longitude - lon_reach, side='left')),
+                     int(np.searchsorted(lon_points, longitude + lon_reach, side='right')))
+        return rows, cols
+
+    def compute_detection_field(self, lat_points: np.array, lon_points: np.array,
+                                distance_mode: str = "euclidean", cos_lat_points: np.array = None) -> np.array:
+        """
+        Computes the detection level of the radar over a whole grid (rows of latitudes, columns of
+        longitudes). Every term is precomputed per row or per column, so each cell only costs a few
+        products and sums; the cosine of the latitude of each row can be given to share it among radars
+        """
+        # Compute the radar's max range
+        max_range = self.compute_max_range()
+
+        # Discrepancies (x - mu) of every row and every column
+        lat_points = np.asarray(lat_points, dtype=np.float64)
+        lon_points = np.asarray(lon_points, dtype=np.float64)
+        d_lat = (lat_points - self.location.latitude)[:, np.newaxis]
+        d_lon = (lon_points - self.location.longitude)[np.newaxis, :]
+
+        # Range gating (comparing squared distances, or the haversine term, to avoid roots per cell)
+        if distance_mode == "euclidean":
+            in_range = (d_lat ** 2 + d_lon ** 2) * METERS_PER_DEGREE ** 2 <= max_range ** 2
+
+        elif distance_mode == "equirectangular":
+            row_cos = np.cos(np.radians((lat_points + self.location.latitude) / 2.0))[:, np.newaxis]
+            in_range = (np.radians(d_lat) ** 2 + (np.radians(d_lon) * row_cos) ** 2) * EARTH_RADIUS ** 2 \
+                       <= max_range ** 2
+
+        elif distance_mode == "haversine":
+            if cos_lat_points is None:
+                cos_lat_points = np.cos(np.radians(lat_points))
+            row_term = np.sin(np.radians(d_lat) / 2.0) ** 2
+            row_cos  = cos_lat_points[:, np.newaxis] * np.cos(np.radians(self.location.latitude))
+            col_term = np.sin(np.radians(d_lon) / 2.0) ** 2
+            max_a    = np.sin(min(max_range / EARTH_RADIUS, np.pi) / 2.0) ** 2
+            in_range = row_term + row_cos * col_term <= max_a
+
+        else:
+            raise ValueError(f"Distance mode must be one of {', '.join(DISTANCE_MODES)}")
+
+        # 2D-multivariate gaussian, expanding the quadratic form into row and column terms
+        inv_cov_matrix = np.linalg.inv(a=self.covariance)
+        det_cov_matrix = np.linalg.det(a=self.covariance)
+        A = 1.0 / (2.0 * np.pi * np.sqrt(det_cov_matrix))
+        _exp = -0.5 * (inv_cov_matrix[0, 0] * d_lat ** 2 +
+                       (inv_cov_matrix[0, 1] + inv_cov_matrix[1, 0]) * d_lat * d_lon +
+                       inv_cov_matrix[1, 1] * d_lon ** 2)
+
+        return np.where(in_range, A * np.exp(_exp), 0.0)
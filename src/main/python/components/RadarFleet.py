@@ -0,0 +1,318 @@
+import csv
+import zipfile
+from itertools import islice
+import numpy as np
+
+from .Location import Location
+from .Boundaries import Boundaries
+from .Radar import Radar
+from .RadarSchedule import RadarSchedule
+
+
+# Per-radar parameters stored as one column each (covariance is stored separately, as (N, 2, 2))
+FIELDS = ("latitudes", "longitudes", "transmission_power", "antenna_gain", "wavelength",
+          "cross_section", "minimum_signal", "total_loss")
+
+# Column names of the CSV inventories (one per field, plus the covariance terms)
+CSV_COLUMNS = ("latitude", "longitude", "transmission_power", "antenna_gain", "wavelength",
+               "cross_section", "minimum_signal", "total_loss")
+CSV_COVARIANCE_COLUMNS = ("var_lat", "cov_lat_lon", "var_lon")
+
+
+def random_covariances(n_radars: np.int32, rng: np.random.Generator) -> np.array:
+    """ Draws n random diagonal 2D-covariance matrices (ensuring semi-positive definite properties) """
+    variances  = rng.uniform(low=2e-5, high=2e-4, size=(n_radars, 2))
+    covariance = np.zeros(shape=(n_radars, 2, 2))
+    covariance[:, 0, 0] = variances[:, 0]
+    covariance[:, 1, 1] = variances[:, 1]
+    return covariance
+
+
+def _memmap_npz_member(archive: zipfile.ZipFile, path: str, name: str) -> np.array:
+    """ Maps an (uncompressed) array of a .npz archive into memory without reading it """
+    info = archive.getinfo(name)
+    with open(path, 'rb') as file:
+        # The data starts after the local file header, its name and its extra field
+        file.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype='<u2')
+        file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+
+        # Then comes the .npy header (shape and type of the array)
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C', offset=offset)
+
+
+class RadarFleet:
+    """ Class that stores a set of radars column-wise (one Numpy array per radar parameter) """
+    def __init__(self,
+                 latitudes:          np.array,
+                 longitudes:         np.array,
+                 transmission_power: np.array,
+                 antenna_gain:       np.array,
+                 wavelength:         np.array,
+                 cross_section:      np.array,
+                 minimum_signal:     np.array,
+                 total_loss:         np.array,
+                 covariance:         np.array):
+        self.latitudes          = latitudes             # Latitude of each radar (geodetic coordinates)
+        self.longitudes         = longitudes            # Longitude of each radar (geodetic coordinates)
+        self.transmission_power = transmission_power    # Transmission power of each radar (in Watts [W])
+        self.antenna_gain       = antenna_gain          # Antenna gain of each radar (no units)
+        self.wavelength         = wavelength            # Wavelength of each radar (in meters)
+        self.cross_section      = cross_section         # Cross-section of each antenna (in squared meters)
+        self.minimum_signal     = minimum_signal        # Sensitivity of each radar (in Watts [W])
+        self.total_loss         = total_loss            # Loss of each radar (no units, discrete)
+        self.covariance         = covariance            # 2D-covariance matrix of each radar, shape (N, 2, 2)
+        self.schedules          = {}                    # Activity schedule of the scheduled radars (by index)
+
+    @classmethod
+    def generate(cls,
+                 boundaries: Boundaries,
+                 height:     np.int32,
+                 width:      np.int32,
+                 n_radars:   np.int32,
+                 rng:        np.random.Generator) -> 'RadarFleet':
+        """ Draws the parameters of n-radars (placed on cells of the map) as arrays, all at once """
+        lat_range = np.linspace(start=boundaries.min_lat, stop=boundaries.max_lat, num=height)
+        lon_range = np.linspace(start=boundaries.min_lon, stop=boundaries.max_lon, num=width)
+
+        # Distinct cells while there are enough of them, repeated cells for larger fleets
+        cells = rng.choice(height * width, size=n_radars, replace=n_radars > height * width)
+
+        # Diagonal covariance matrices (ensuring semi-positive definite properties)
+        covariance = random_covariances(n_radars, rng)
+
+        return cls(latitudes=lat_range[cells // width],
+                   longitudes=lon_range[cells % width],
+                   transmission_power=rng.uniform(low=1, high=1000000, size=n_radars),
+                   antenna_gain=rng.uniform(low=10, high=50, size=n_radars),
+                   wavelength=rng.uniform(low=0.001, high=10.0, size=n_radars),
+                   cross_section=rng.uniform(low=0.1, high=10.0, size=n_radars),
+                   minimum_signal=rng.uniform(low=1e-15, high=1e-10, size=n_radars),
+                   total_loss=rng.integers(low=1, high=10, size=n_radars),
+                   covariance=covariance)
+
+    @classmethod
+    def generate_legacy(cls,
+                        boundaries: Boundaries,
+                        height:     np.int32,
+                        width:      np.int32,
+                        n_radars:   np.int32) -> 'RadarFleet':
+        """
+        Draws n-radars from the global numpy generator in the original order (one radar at a time),
+        so that the executions seeded with 'np.random.seed' keep their radars. Only valid for
+        fleets that fit in distinct rows and columns of the map
+        """
+        lat_range = np.linspace(start=boundaries.min_lat, stop=boundaries.max_lat, num=height)
+        lon_range = np.linspace(start=boundaries.min_lon, stop=boundaries.max_lon, num=width)
+        latitudes  = np.random.choice(a=lat_range, size=n_radars, replace=False)
+        longitudes = np.random.choice(a=lon_range, size=n_radars, replace=False)
+
+        columns = np.zeros(shape=(n_radars, 5))      # Power, gain, wavelength, cross-section and sensitivity
+        total_loss = np.zeros(shape=n_radars, dtype=np.int64)
+        covariance = np.zeros(shape=(n_radars, 2, 2))
+        for i in range(n_radars):
+            # Same draws (and bounds, even the reversed ones) as the original radar generation
+            columns[i] = (np.random.uniform(low=1, high=1000000),
+                          np.random.uniform(low=10, high=50),
+                          np.random.uniform(low=0.001, high=10.0),
+                          np.random.uniform(low=0.1, high=10.0),
+                          np.random.uniform(low=1e-10, high=1e-15))
+            total_loss[i] = np.random.randint(low=1, high=10)
+            covariance[i, 0, 0], covariance[i, 1, 1] = np.random.uniform(size=2, low=2e-5, high=2e-4)
+
+        return cls(latitudes=latitudes,
+                   longitudes=longitudes,
+                   transmission_power=columns[:, 0],
+                   antenna_gain=columns[:, 1],
+                   wavelength=columns[:, 2],
+                   cross_section=columns[:, 3],
+                   minimum_signal=columns[:, 4],
+                   total_loss=total_loss,
+                   covariance=covariance)
+
+    @classmethod
+    def from_radars(cls, radars: list) -> 'RadarFleet':
+        """ Builds the columnar representation of a list of Radar objects """
+        fleet = cls(latitudes=np.array([radar.location.latitude for radar in radars], dtype=np.float64),
+                    longitudes=np.array([radar.location.longitude for radar in radars], dtype=np.float64),
+                    transmission_power=np.array([radar.transmission_power for radar in radars], dtype=np.float64),
+                    antenna_gain=np.array([radar.antenna_gain for radar in radars], dtype=np.float64),
+                    wavelength=np.array([radar.wavelength for radar in radars], dtype=np.float64),
+                    cross_section=np.array([radar.cross_section for radar in radars], dtype=np.float64),
+                    minimum_signal=np.array([radar.minimum_signal for radar in radars], dtype=np.float64),
+                    total_loss=np.array([radar.total_loss for radar in radars]),
+                    covariance=np.array([radar.covariance for radar in radars], dtype=np.float64).reshape(-1, 2, 2))
+        fleet.schedules = {index: radar.schedule for index, radar in enumerate(radars) if radar.schedule is not None}
+        return fleet
+
+    @classmethod
+    def load_npz(cls, path: str, mmap: bool = True, seed=None) -> 'RadarFleet':
+        """
+        Loads a fleet stored with 'save_npz'. Uncompressed archives are memory mapped (the arrays
+        are read from disk on demand); a missing covariance array is drawn randomly
+        """
+        columns = {}
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+            for field in FIELDS + ("covariance",):
+                name = f"{field}.npy"
+                if name not in names:
+                    if field == "covariance":
+                        continue
+                    raise ValueError(f"Radar inventory is missing the '{field}' array")
+
+                if mmap and archive.getinfo(name).compress_type == zipfile.ZIP_STORED:
+                    columns[field] = _memmap_npz_member(archive, path, name)
+                else:
+                    with archive.open(name) as member:
+                        columns[field] = np.lib.format.read_array(member)
+
+        if "covariance" not in columns:
+            columns["covariance"] = random_covariances(len(columns["latitudes"]), np.random.default_rng(seed))
+
+        return cls(**columns)
+
+    def save_npz(self, path: str, compressed: bool = False) -> None:
+        """ Stores the fleet as a .npz archive (uncompressed by default, so that it can be memory mapped) """
+        columns = {field: np.asarray(getattr(self, field)) for field in FIELDS + ("covariance",)}
+        with open(path, 'wb') as file:
+            if compressed:
+                np.savez_compressed(file, **columns)
+            else:
+                np.savez(file, **columns)
+
+    @classmethod
+    def read_csv(cls, path: str, chunk_size: int = 65536, seed=None) -> 'RadarFleet':
+        """
+        Loads a CSV inventory (with a header naming the columns) parsing it in chunks of rows.
+        The covariance columns (var_lat, cov_lat_lon, var_lon) are optional: if they are missing
+        the covariance matrices are drawn randomly
+        """
+        chunks = []
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            header = [column.strip() for column in next(csv.reader([file.readline()]), [])]
+            missing = [column for column in CSV_COLUMNS if column not in header]
+            if missing:
+                raise ValueError(f"Radar inventory is missing the columns: {', '.join(missing)}")
+
+            has_covariance = all(column in header for column in CSV_COVARIANCE_COLUMNS)
+            selected = CSV_COLUMNS + (CSV_COVARIANCE_COLUMNS if has_covariance else ())
+            indices = [header.index(column) for column in selected]
+
+            first_line = 2
+            while True:
+                lines = list(islice(file, chunk_size))
+                if not lines:
+                    break
+                try:
+                    chunk = np.loadtxt(lines, delimiter=",", usecols=indices, dtype=np.float64, ndmin=2)
+                except ValueError as error:
+                    raise ValueError(f"Invalid radar inventory rows {first_line}-{first_line + len(lines) - 1}: {error}")
+                chunks.append(chunk)
+                first_line += len(lines)
+
+        table = np.concatenate(chunks) if chunks else np.zeros(shape=(0, len(selected)))
+        columns = {field: np.ascontiguousarray(table[:, i]) for i, field in enumerate(FIELDS)}
+
+        if has_covariance:
+            var_lat, cov_lat_lon, var_lon = table[:, len(FIELDS)], table[:, len(FIELDS) + 1], table[:, len(FIELDS) + 2]
+            columns["covariance"] = np.stack([np.stack([var_lat, cov_lat_lon], axis=1),
+                                              np.stack([cov_lat_lon, var_lon], axis=1)], axis=1)
+        else:
+            columns["covariance"] = random_covariances(len(table), np.random.default_rng(seed))
+
+        return cls(**columns)
+
+    def write_csv(self, path: str, chunk_size: int = 65536) -> None:
+        """ Stores the fleet as a CSV inventory, writing it in chunks of rows """
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(",".join(CSV_COLUMNS + CSV_COVARIANCE_COLUMNS) + "\n")
+            for start in range(0, len(self), chunk_size):
+                end = start + chunk_size
+                table = np.column_stack([np.asarray(getattr(self, field)[start:end], dtype=np.float64)
+                                         for field in FIELDS] +
+                                        [self.covariance[start:end, 0, 0],
+                                         self.covariance[start:end, 0, 1],
+                                         self.covariance[start:end, 1, 1]])
+                np.savetxt(file, table, delimiter=",", fmt="%.17g")
+
+    def validate(self, boundaries: Boundaries = None) -> None:
+        """ Checks every radar at once, raising a ValueError that summarises the invalid ones """
+        n_radars = len(self)
+        for field in FIELDS:
+            if len(getattr(self, field)) != n_radars:
+                raise ValueError(f"Radar inventory column '{field}' has {len(getattr(self, field))} rows, expected {n_radars}")
+        if np.shape(self.covariance) != (n_radars, 2, 2):
+            raise ValueError(f"Radar covariances must have shape ({n_radars}, 2, 2)")
+
+        covariance = np.asarray(self.covariance)
+        checks = {
+            "non-finite values":     ~np.all([np.isfinite(getattr(self, field)) for field in FIELDS], axis=0) |
+                                     ~np.isfinite(covariance).all(axis=(1, 2)),
+            "transmission power":    ~(np.asarray(self.transmission_power) > 0),
+            "antenna gain":          ~(np.asarray(self.antenna_gain) > 0),
+            "wavelength":            ~(np.asarray(self.wavelength) > 0),
+            "cross-section":         ~(np.asarray(self.cross_section) > 0),
+            "minimum signal":        ~(np.asarray(self.minimum_signal) > 0),
+            "total loss":            ~(np.asarray(self.total_loss) >= 1),
+            "covariance (not symmetric positive definite)":
+                                     ~((covariance[:, 0, 1] == covariance[:, 1, 0]) &
+                                       (covariance[:, 0, 0] > 0) &
+                                       (covariance[:, 0, 0] * covariance[:, 1, 1] > covariance[:, 0, 1] ** 2)),
+        }
+        if boundaries is not None:
+            checks["location (outside the map boundaries)"] = ~(
+                (np.asarray(self.latitudes) >= boundaries.min_lat) & (np.asarray(self.latitudes) <= boundaries.max_lat) &
+                (np.asarray(self.longitudes) >= boundaries.min_lon) & (np.asarray(self.longitudes) <= boundaries.max_lon))
+
+        errors = [f"{np.count_nonzero(invalid)} with invalid {name} (first at index {np.argmax(invalid)})"
+                  for name, invalid in checks.items() if np.any(invalid)]
+        if errors:
+            raise ValueError("Invalid radars: " + "; ".join(errors))
+
+    def set_schedule(self, index: int, schedule: RadarSchedule) -> None:
+        """ Assigns an activity schedule to a radar (None makes it always on and static again) """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Radar index {index} out of range")
+
+        if schedule is None:
+            self.schedules.pop(index, None)
+        else:
+            self.schedules[index] = schedule
+
+    def get_locations_numpy(self) -> np.array:
+        """ Returns an array with the coordinates (lat, lon) of each radar """
+        return np.stack([self.latitudes, self.longitudes], axis=1).astype(np.float32)
+
+    def compute_max_range(self) -> np.array:
+        """ Computes the maximum detection range of every radar at once """
+        A = self.transmission_power * (self.antenna_gain ** 2) * (self.wavelength ** 2) * self.cross_section
+        B = ((4.0 * np.pi) ** 3) * self.minimum_signal * self.total_loss
+        return (A / B) ** (1 / 4)
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def __getitem__(self, index: int) -> Radar:
+        """ Builds the Radar object of a single radar of the fleet """
+        return Radar(location=Location(latitude=self.latitudes[index], longitude=self.longitudes[index]),
+                     transmission_power=self.transmission_power[index],
+                     antenna_gain=self.antenna_gain[index],
+                     wavelength=self.wavelength[index],
+                     cross_section=self.cross_section[index],
+                     minimum_signal=self.minimum_signal[index],
+                     total_loss=self.total_loss[index],
+                     covariance=self.covariance[index],
+                     schedule=self.schedules.get(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
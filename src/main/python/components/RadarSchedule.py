@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class RadarSchedule:
+    """ Class that models when a radar is switched on and, for rotating radars, where its beam points """
+    def __init__(self,
+                 period:          np.float32 = None,
+                 active_windows:  list = None,
+                 rotation_period: np.float32 = None,
+                 beam_width:      np.float32 = 2.0 * np.pi,
+                 initial_heading: np.float32 = 0.0):
+        self.period          = period               # Period of the on/off cycle (in seconds, None = not periodic)
+        self.active_windows  = active_windows       # List of (start, end) times when the radar is on (None = always on)
+        self.rotation_period = rotation_period      # Time of a full turn of the antenna (in seconds, None = static)
+        self.beam_width      = beam_width           # Angular width of the beam (in radians)
+        self.initial_heading = initial_heading      # Heading of the beam at time 0 (in radians, clockwise from north)
+
+        if period is not None and period <= 0:
+            raise ValueError("Schedule period must be positive")
+        if rotation_period is not None and rotation_period <= 0:
+            raise ValueError("Rotation period must be positive")
+        if not 0 < beam_width <= 2.0 * np.pi:
+            raise ValueError("Beam width must be between 0 and 2*pi radians")
+
+    @property
+    def rotates(self) -> bool:
+        """ Whether the covered area changes with time (rotating antenna with a partial beam) """
+        return self.rotation_period is not None and self.beam_width < 2.0 * np.pi
+
+    def is_active(self, time: np.float32) -> bool:
+        """ Checks whether the radar is switched on at the given time """
+        if self.active_windows is None:
+            return True
+
+        if self.period is not None:
+            time = time % self.period
+        return any(start <= time < end for start, end in self.active_windows)
+
+    def heading(self, time: np.float32) -> np.float32:
+        """ Returns the heading of the beam at the given time (None if the radar does not rotate) """
+        if not self.rotates:
+            return None
+        return (self.initial_heading + 2.0 * np.pi * time / self.rotation_period) % (2.0 * np.pi)
+
+    def beam_mask(self, bearings: np.array, heading: np.float32) -> np.array:
+        """ Returns which of the bearings (in radians, clockwise from north) fall inside the beam """
+        deviation = (bearings - heading + np.pi) % (2.0 * np.pi) - np.pi
+        return np.abs(deviation) <= self.beam_width / 2.0
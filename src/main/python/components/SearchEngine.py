@@ -1,14 +1,26 @@
+import heapq
+import time
 import numpy as np
 import networkx as nx
 from tqdm import tqdm
 
 from .Boundaries import Boundaries
+from .Map import EPSILON
 
 
 # Number of nodes expanded in the heuristic search (stored in a global variable
 # to be updated from the heuristic functions)
 NODES_EXPANDED = 0
 
+# Offsets (dy, dx) of the neighbours connected to each cell (for each connectivity)
+NEIGHBOURS = {
+    4: [(-1, 0), (1, 0), (0, -1), (0, 1)],
+    8: [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)],
+}
+
+# Available search modes: A* over the grid graph, or any-angle Theta*
+SEARCH_MODES = ("astar", "theta_star")
+
 def h1(current_node, objective_node) -> np.float32:
     """ First heuristic to implement - Euclidean distance """
     global NODES_EXPANDED
@@ -23,8 +35,47 @@ def h2(current_node, objective_node) -> np.float32:
     NODES_EXPANDED += 1
     return h
 
-def build_graph(detection_map: np.array, tolerance: np.float32) -> nx.DiGraph:
-    """Builds a directed graph from the detection map with proper node validation"""
+def _edge_weight(detection_map: np.array, tolerance: np.float32, current: tuple, neighbour: tuple) -> np.float32:
+    """
+    Returns the weight of the edge between two neighbouring cells (the detection level of the
+    destination times the length of the step), or None if the edge is not valid. Diagonal steps
+    are only valid if they do not cut the corner of a cell above the tolerance
+    """
+    height, width = detection_map.shape
+    if not (0 <= neighbour[0] < height and 0 <= neighbour[1] < width):
+        return None
+    if detection_map[current] > tolerance or detection_map[neighbour] > tolerance:
+        return None
+
+    # Orthogonal step
+    if current[0] == neighbour[0] or current[1] == neighbour[1]:
+        return detection_map[neighbour]
+
+    # Diagonal step
+    if detection_map[current[0], neighbour[1]] > tolerance or detection_map[neighbour[0], current[1]] > tolerance:
+        return None
+    return detection_map[neighbour] * np.sqrt(2)
+
+def _read_only_copy(detection_map: np.array) -> np.array:
+    """ Returns a copy of the detection map that cannot be modified (kept inside the graphs) """
+    detection_map = np.array(detection_map, copy=True)
+    detection_map.setflags(write=False)
+    return detection_map
+
+def _heuristic_scale(graph: nx.DiGraph, cheapest_cost: np.float32) -> np.float32:
+    """
+    Scale (cost per cell) that keeps h1 and h2 admissible and consistent on the graph: the
+    Manhattan distance counts two cells for a diagonal step that only costs sqrt(2) of them
+    """
+    if graph.graph.get('connectivity', 4) == 8:
+        return cheapest_cost / np.sqrt(2)
+    return cheapest_cost
+
+def build_graph(detection_map: np.array, tolerance: np.float32, connectivity: int = 4) -> nx.DiGraph:
+    """
+    Builds a directed graph from the detection map with proper node validation (each cell
+    connected to its 4 orthogonal neighbours, or also to the diagonal ones if connectivity is 8)
+    """
     if tolerance <= 1e-4:
         raise ValueError("Tolerance must be greater than 1e-4")
     if tolerance > 1:
@@ -33,38 +84,31 @@ def build_graph(detection_map: np.array, tolerance: np.float32) -> nx.DiGraph:
         raise ValueError("Missing required tolerance argument")
     if type(tolerance) != np.float32 and type(tolerance) != float:
         raise TypeError("Tolerance must be numeric")
+    if connectivity not in NEIGHBOURS:
+        raise ValueError("Connectivity must be 4 or 8")
 
 
-    graph = nx.DiGraph()
-    height, width = detection_map.shape
+    # A copy of the map is kept in the graph to evaluate straight (any-angle) segments later on
+    graph = nx.DiGraph(detection_map=_read_only_copy(detection_map), tolerance=tolerance,
+                       connectivity=connectivity)
 
-    # Add all nodes to ensure complete coordinate space
-    for y in range(height):
-        for x in range(width):
-            if detection_map[y, x] <= tolerance:
-                graph.add_node((int(y), int(x)))
+    # Only the cells below tolerance (in row-major order) become nodes, so cells left out of a
+    # corridor (infinite detection level) cost nothing
+    passable = [tuple(cell) for cell in np.argwhere(detection_map <= tolerance).tolist()]
+    graph.add_nodes_from(passable)
 
     # Connect valid edges
-    for y in range(height):
-        for x in range(width):
-            current = (y, x)
-
-            # Skip if current node is above tolerance
-            if detection_map[y, x] > tolerance:
-                continue
-
-            # Check all 4 possible neighbors
-            for distance_y, distance_x in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                neighbour_y, neighbour_x = y + distance_y, x + distance_x
+    for current in passable:
+        y, x = current
 
-                # Validate neighbor coordinates
-                if 0 <= neighbour_y < height and 0 <= neighbour_x < width:
-                    neighbor = (neighbour_y, neighbour_x)
+        # Check all possible neighbors
+        for distance_y, distance_x in NEIGHBOURS[connectivity]:
+            neighbor = (y + distance_y, x + distance_x)
 
-                    # Only add edge if destination is below tolerance
-                    if detection_map[neighbour_y, neighbour_x] <= tolerance:
-                        graph.add_edge(current, neighbor,
-                                       weight=detection_map[neighbour_y, neighbour_x])
+            # Only add edge if it is inside the map and below tolerance
+            weight = _edge_weight(detection_map, tolerance, current, neighbor)
+            if weight is not None:
+                graph.add_edge(current, neighbor, weight=weight)
 
     # Verify graph connectivity
     if graph.number_of_nodes() == 0:
@@ -72,6 +116,82 @@ def build_graph(detection_map: np.array, tolerance: np.float32) -> nx.DiGraph:
 
     return graph
 
+def line_of_sight_cost(detection_map: np.array, tolerance: np.float32, start: tuple, end: tuple) -> np.float32:
+    """
+    Computes the cost of flying straight from one cell to another: the detection level of every
+    cell crossed (sampled once per step along the longest axis) times the length flown in it.
+    Returns None if the segment crosses (or cuts the corner of) a cell above the tolerance
+    """
+    distance_y, distance_x = end[0] - start[0], end[1] - start[1]
+    steps = max(abs(distance_y), abs(distance_x))
+    if steps == 0:
+        return 0.0
+
+    # Cells crossed by the segment (excluding the starting one)
+    t = np.arange(1, steps + 1) / steps
+    ys = np.rint(start[0] + t * distance_y).astype(np.int64)
+    xs = np.rint(start[1] + t * distance_x).astype(np.int64)
+    values = detection_map[ys, xs]
+    if np.any(values > tolerance):
+        return None
+
+    # Diagonal moves between consecutive cells must not cut corners (as in the 8-connected graph)
+    previous_ys = np.concatenate(([start[0]], ys[:-1]))
+    previous_xs = np.concatenate(([start[1]], xs[:-1]))
+    diagonal = (ys != previous_ys) & (xs != previous_xs)
+    if np.any(detection_map[previous_ys[diagonal], xs[diagonal]] > tolerance) or \
+       np.any(detection_map[ys[diagonal], previous_xs[diagonal]] > tolerance):
+        return None
+
+    return np.sum(values, dtype=np.float64) * (np.hypot(distance_y, distance_x) / steps)
+
+def theta_star_path(graph: nx.DiGraph, start: tuple, end: tuple, heuristic_function) -> list:
+    """
+    Any-angle Theta* search: like A*, but each node may be reached straight from its parent's
+    parent when there is line of sight, so the path is a short list of waypoints
+    """
+    detection_map = graph.graph['detection_map']
+    tolerance = graph.graph['tolerance']
+
+    cost = {start: 0.0}
+    parent = {start: start}
+    closed = set()
+    counter = 0     # Tie-breaker (nodes are never compared)
+    queue = [(heuristic_function(start, end), counter, start)]
+
+    while queue:
+        _, _, node = heapq.heappop(queue)
+        if node in closed:
+            continue
+        if node == end:
+            path = [node]
+            while path[-1] != start:
+                path.append(parent[path[-1]])
+            return path[::-1]
+        closed.add(node)
+
+        for successor, attributes in graph[node].items():
+            if successor in closed:
+                continue
+
+            # Straight from the grandparent if it is visible, through the node otherwise
+            grandparent = parent[node]
+            segment_cost = None
+            if grandparent != node:
+                segment_cost = line_of_sight_cost(detection_map, tolerance, grandparent, successor)
+            if segment_cost is not None:
+                new_cost, new_parent = cost[grandparent] + segment_cost, grandparent
+            else:
+                new_cost, new_parent = cost[node] + attributes['weight'], node
+
+            if new_cost < cost.get(successor, np.inf):
+                cost[successor] = new_cost
+                parent[successor] = new_parent
+                counter += 1
+                heapq.heappush(queue, (new_cost + heuristic_function(successor, end), counter, successor))
+
+    raise nx.NetworkXNoPath(f"No path between {start} and {end}")
+
 def discretize_coords(high_level_plan: np.array, boundaries: Boundaries,
                       map_width: np.int32, map_height: np.int32) -> np.array:
     """Converts coordinates with boundary checking"""
@@ -95,16 +215,9 @@ def discretize_coords(high_level_plan: np.array, boundaries: Boundaries,
         discretized.append((y, x))
     return np.array(discretized)
 
-def path_finding(graph: nx.DiGraph,
-                 heuristic_function,
-                 locations: np.array,
-                 initial_location_index: np.int32,
-                 boundaries: Boundaries,
-                 map_width: np.int32,
-                 map_height: np.int32) -> tuple:
-    """Robust path finding with coordinate validation and error handling"""
-    global NODES_EXPANDED
-
+def _discretize_locations(locations: np.array, boundaries: Boundaries,
+                          map_width: np.int32, map_height: np.int32) -> list:
+    """ Discretizes the POIs into grid nodes (tuples of native ints), validating them """
     try:
         # Discretize coordinates with boundary checking
         discretized_locations = discretize_coords(locations, boundaries, map_width, map_height)
@@ -116,6 +229,47 @@ def path_finding(graph: nx.DiGraph,
     if len(discretized_locations) <= 1:
         raise ValueError("At least 2 POIs required for pathfinding")
 
+    return discretized_locations
+
+def _to_path_segment(path: list, boundaries: Boundaries,
+                     map_width: np.int32, map_height: np.int32) -> list:
+    """ Converts a path of grid nodes to include both coordinate systems """
+    path_segment = []
+    for y, x in path:
+        lat = boundaries.min_lat + (y / (map_height - 1)) * (boundaries.max_lat - boundaries.min_lat)
+        lon = boundaries.min_lon + (x / (map_width - 1)) * (boundaries.max_lon - boundaries.min_lon)
+
+        path_segment.append({
+            'grid': (int(y), int(x)),  # Ensure native ints
+            'geo': (float(lat), float(lon))
+        })
+    return path_segment
+
+def path_finding(graph: nx.DiGraph,
+                 heuristic_function,
+                 locations: np.array,
+                 initial_location_index: np.int32,
+                 boundaries: Boundaries,
+                 map_width: np.int32,
+                 map_height: np.int32,
+                 search_mode: str = "astar") -> tuple:
+    """
+    Robust path finding with coordinate validation and error handling (with A* over the graph,
+    or any-angle Theta* if the search mode is "theta_star")
+    """
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Search mode must be one of {', '.join(SEARCH_MODES)}")
+
+    # Count the heuristic evaluations of this call only (so that concurrent searches do not
+    # share the global counter)
+    nodes_expanded = [0]
+
+    def counted_heuristic(current_node, objective_node):
+        nodes_expanded[0] += 1
+        return heuristic_function(current_node, objective_node)
+
+    discretized_locations = _discretize_locations(locations, boundaries, map_width, map_height)
+
     solution_plan = []
     total_nodes_expanded = 0
     has_invalid_path = False
@@ -136,28 +290,20 @@ def path_finding(graph: nx.DiGraph,
             break
 
         try:
-            NODES_EXPANDED = 0  # Reset counter
+            nodes_expanded[0] = 0  # Reset counter
 
             # Find path with type-safe coordinates
-            path = nx.astar_path(graph,
-                                tuple(start),  # Ensure tuple type
-                                tuple(end),
-                                heuristic=heuristic_function,
-                                weight='weight')
-
-            # Convert path to include both coordinate systems
-            path_segment = []
-            for y, x in path:
-                lat = boundaries.min_lat + (y / (map_height - 1)) * (boundaries.max_lat - boundaries.min_lat)
-                lon = boundaries.min_lon + (x / (map_width - 1)) * (boundaries.max_lon - boundaries.min_lon)
-
-                path_segment.append({
-                    'grid': (int(y), int(x)),  # Ensure native ints
-                    'geo': (float(lat), float(lon))
-                })
-
-            solution_plan.append(path_segment)
-            total_nodes_expanded += NODES_EXPANDED
+            if search_mode == "theta_star":
+                path = theta_star_path(graph, tuple(start), tuple(end), counted_heuristic)
+            else:
+                path = nx.astar_path(graph,
+                                    tuple(start),  # Ensure tuple type
+                                    tuple(end),
+                                    heuristic=counted_heuristic,
+                                    weight='weight')
+
+            solution_plan.append(_to_path_segment(path, boundaries, map_width, map_height))
+            total_nodes_expanded += nodes_expanded[0]
 
         except nx.NetworkXNoPath:
             print(f"No valid path from {start} to {end}")
@@ -176,6 +322,219 @@ def path_finding(graph: nx.DiGraph,
 
     return solution_plan, total_nodes_expanded
 
+def corridor_regions(discretized_locations: list, margin: np.int32,
+                     map_height: np.int32, map_width: np.int32, per_leg: bool = True) -> list:
+    """
+    Computes the regions (row_start, row_stop, col_start, col_stop) of a corridor around the POIs:
+    the bounding box of every leg (pair of consecutive POIs) or of all the POIs, widened by the
+    margin (in cells) and clipped to the map
+    """
+    if per_leg:
+        groups = [discretized_locations[i:i + 2] for i in range(len(discretized_locations) - 1)]
+    else:
+        groups = [discretized_locations]
+
+    regions = []
+    for group in groups:
+        rows = [y for y, _ in group]
+        cols = [x for _, x in group]
+        regions.append((max(min(rows) - margin, 0), min(max(rows) + margin + 1, map_height),
+                        max(min(cols) - margin, 0), min(max(cols) + margin + 1, map_width)))
+    return regions
+
+def corridor_path_finding(radar_map,
+                          tolerance: np.float32,
+                          heuristic_function,
+                          locations: np.array,
+                          initial_location_index: np.int32 = 0,
+                          margin: np.int32 = 8,
+                          per_leg: bool = True,
+                          connectivity: int = 4,
+                          search_mode: str = "astar") -> tuple:
+    """
+    Path finding that only computes the detection map and builds the graph inside a corridor
+    around the POIs. If no path is found inside it, the margin is doubled and the search repeated,
+    up to the whole map (the path found is the cheapest one inside the last corridor). POIs above
+    the tolerance fail at once, since no corridor can make them reachable.
+    Returns the solution plan, the expanded nodes and the graph of the last corridor
+    """
+    map_height, map_width = radar_map.height, radar_map.width
+    discretized_locations = _discretize_locations(locations, radar_map.boundaries, map_width, map_height)
+    discretized_locations = discretized_locations[initial_location_index:]
+
+    while True:
+        regions = corridor_regions(discretized_locations, margin, map_height, map_width, per_leg)
+        detection_map = radar_map.compute_detection_map(regions=regions)
+        graph = build_graph(detection_map, tolerance, connectivity)
+
+        # The POIs are always inside the corridor, so their detection levels are the real ones
+        for node in discretized_locations:
+            if node not in graph:
+                print(f"Warning: Target node {node} not in graph (possibly in no-fly zone)")
+                raise RuntimeError("Pathfinding aborted due to invalid path segment")
+
+        try:
+            solution_plan, nodes_expanded = path_finding(graph, heuristic_function, locations,
+                                                         initial_location_index, radar_map.boundaries,
+                                                         map_width, map_height, search_mode)
+            return solution_plan, nodes_expanded, graph
+
+        except RuntimeError:
+            # Only a missing path between reachable POIs is solved by widening the corridor
+            if margin >= max(map_height, map_width):
+                raise
+
+            margin = max(2 * margin, 1)
+            print(f"No path inside the corridor, expanding its margin to {margin} cells")
+
+def ara_star_path(graph: nx.DiGraph, start: tuple, end: tuple, heuristic_function,
+                  heuristic_scale: np.float32, deadline: float, initial_weight: np.float32 = 100.0,
+                  weight_decay: np.float32 = 0.5, target_bound: np.float32 = 1.0) -> tuple:
+    """
+    Anytime Repairing A* (ARA*): finds a first path quickly with a heavily weighted heuristic and
+    keeps improving it, lowering the weight and reusing the previous search, until the achieved
+    suboptimality bound reaches the target or the deadline (time.perf_counter) passes. The
+    heuristic is scaled by the cheapest cell so that the reported bound holds.
+    Returns the path and the search statistics (bound, iterations, expanded nodes)
+    """
+    def h(node):
+        return heuristic_function(node, end) * heuristic_scale
+
+    cost = {start: 0.0}
+    parent = {start: None}
+    closed = set()
+    inconsistent = set()
+    weight = initial_weight
+    queue = []
+    statistics = {'bound': np.inf, 'iterations': 0, 'nodes_expanded': 0,
+                  'first_solution_expansions': None, 'weight': weight}
+
+    def improve_path(check_deadline: bool) -> bool:
+        """ Expands nodes until the goal is the best node of the queue (False if the deadline passed) """
+        while queue and cost.get(end, np.inf) > queue[0][0]:
+            key, node = heapq.heappop(queue)
+            if node in closed or key != cost[node] + weight * h(node):
+                continue        # Outdated entry
+            closed.add(node)
+            statistics['nodes_expanded'] += 1
+            if check_deadline and statistics['nodes_expanded'] % 256 == 0 and time.perf_counter() > deadline:
+                return False
+
+            for successor, attributes in graph[node].items():
+                new_cost = cost[node] + attributes['weight']
+                if new_cost < cost.get(successor, np.inf):
+                    cost[successor] = new_cost
+                    parent[successor] = node
+                    if successor in closed:
+                        inconsistent.add(successor)
+                    else:
+                        heapq.heappush(queue, (new_cost + weight * h(successor), successor))
+        return True
+
+    def extract_path() -> list:
+        path = [end]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+        return path[::-1]
+
+    def achieved_bound() -> np.float32:
+        """ Suboptimality bound: cost of the path over a lower bound of the optimal cost """
+        pending = [node for _, node in queue if node not in closed] + list(inconsistent)
+        if not pending:
+            return 1.0
+        lower_bound = min(cost[node] + h(node) for node in pending)
+        if lower_bound <= 0:
+            return weight
+        return max(1.0, min(weight, cost[end] / lower_bound))
+
+    # First solution (ignoring the deadline, there must be one)
+    heapq.heappush(queue, (weight * h(start), start))
+    improve_path(check_deadline=False)
+    if cost.get(end, np.inf) == np.inf:
+        raise nx.NetworkXNoPath(f"No path between {start} and {end}")
+
+    best_path = extract_path()
+    statistics.update(bound=achieved_bound(), iterations=1,
+                      first_solution_expansions=statistics['nodes_expanded'])
+
+    # Improve it while there is time left and the bound is not good enough
+    while statistics['bound'] > target_bound and weight > 1.0 and time.perf_counter() < deadline:
+        weight = max(1.0, 1.0 + (weight - 1.0) * weight_decay)
+
+        # Reopen the inconsistent nodes and reorder the queue for the new weight
+        pending = {node for _, node in queue if node not in closed} | inconsistent
+        queue = [(cost[node] + weight * h(node), node) for node in pending]
+        heapq.heapify(queue)
+        inconsistent.clear()
+        closed.clear()
+
+        if not improve_path(check_deadline=True):
+            break
+        best_path = extract_path()
+        statistics.update(bound=achieved_bound(), iterations=statistics['iterations'] + 1, weight=weight)
+
+    return best_path, statistics
+
+def anytime_path_finding(graph: nx.DiGraph,
+                         heuristic_function,
+                         locations: np.array,
+                         initial_location_index: np.int32,
+                         boundaries: Boundaries,
+                         map_width: np.int32,
+                         map_height: np.int32,
+                         time_budget: float = 1.0,
+                         initial_weight: np.float32 = None,
+                         target_bound: np.float32 = 1.0) -> tuple:
+    """
+    Anytime version of path_finding (ARA* per leg): the time budget (in seconds) is shared among
+    the legs and each one stops improving once its bound reaches the target. By default the first
+    search weights the heuristic as if every cell had the mean cost of the graph. Returns the
+    solution plan, the number of expanded nodes and the statistics of the search, including the
+    achieved bound of the whole plan (its cost is at most 'bound' times the optimal one)
+    """
+    deadline = time.perf_counter() + time_budget
+    discretized_locations = _discretize_locations(locations, boundaries, map_width, map_height)
+
+    # Cheapest edge (an orthogonal one if there are diagonals), which keeps the heuristic admissible
+    weights = np.fromiter((weight for _, _, weight in graph.edges(data='weight')), dtype=np.float64)
+    cheapest = np.min(weights) if weights.size else EPSILON
+    heuristic_scale = _heuristic_scale(graph, cheapest)
+    if initial_weight is None:
+        initial_weight = max(1.0, np.mean(weights) / cheapest) if weights.size else 1.0
+
+    solution_plan = []
+    search_stats = {'bound': 1.0, 'legs': []}
+    legs = list(range(initial_location_index, len(discretized_locations) - 1))
+
+    for number, i in enumerate(legs):
+        start = discretized_locations[i]
+        end = discretized_locations[i + 1]
+
+        # Validate nodes exist in graph
+        for node in (start, end):
+            if node not in graph:
+                print(f"Warning: Target node {node} not in graph (possibly in no-fly zone)")
+                raise RuntimeError("Pathfinding aborted due to invalid path segment")
+
+        # Each leg gets an equal share of the time left
+        now = time.perf_counter()
+        leg_deadline = now + max(0.0, deadline - now) / (len(legs) - number)
+
+        try:
+            path, statistics = ara_star_path(graph, start, end, heuristic_function, heuristic_scale,
+                                             leg_deadline, initial_weight=initial_weight,
+                                             target_bound=target_bound)
+        except nx.NetworkXNoPath:
+            print(f"No valid path from {start} to {end}")
+            raise RuntimeError("Pathfinding aborted due to invalid path segment")
+
+        solution_plan.append(_to_path_segment(path, boundaries, map_width, map_height))
+        search_stats['legs'].append(statistics)
+        search_stats['bound'] = max(search_stats['bound'], statistics['bound'])
+
+    total_nodes_expanded = sum(statistics['nodes_expanded'] for statistics in search_stats['legs'])
+    return solution_plan, total_nodes_expanded, search_stats
+
 def compute_path_cost(graph: nx.DiGraph, solution_plan: list) -> np.float32:
     """ Computes the total cost of the whole planning solution """
     total_cost = 0.0
@@ -184,6 +543,248 @@ def compute_path_cost(graph: nx.DiGraph, solution_plan: list) -> np.float32:
         for i in range(len(path_segment) - 1):
             start = path_segment[i]['grid']
             end = path_segment[i+1]['grid']
-            total_cost += graph[start][end]['weight']
+            if graph.has_edge(start, end):
+                total_cost += graph[start][end]['weight']
+            else:
+                # Any-angle waypoints are joined by straight segments
+                segment_cost = line_of_sight_cost(graph.graph['detection_map'], graph.graph['tolerance'], start, end)
+                if segment_cost is None:
+                    raise ValueError(f"No line of sight between {start} and {end}")
+                total_cost += segment_cost
+
+    return total_cost
+
+def update_graph(graph: nx.DiGraph, detection_map: np.array, tolerance: np.float32,
+                 changed_cells: np.array) -> set:
+    """
+    Updates a graph built by build_graph after some cells of the detection map changed (adding,
+    removing or re-weighting their nodes and edges). Returns the nodes whose incoming edges changed
+    """
+    height, width = detection_map.shape
+    graph.graph['detection_map'] = _read_only_copy(detection_map)
+    offsets = NEIGHBOURS[graph.graph.get('connectivity', 4)]
+    affected = set()
+
+    # Every edge depending on a changed cell (as an endpoint, or as the corner cut by a diagonal
+    # edge) joins two cells of the 3x3 block around it
+    block = set()
+    for y, x in changed_cells:
+        for distance_y in (-1, 0, 1):
+            for distance_x in (-1, 0, 1):
+                if 0 <= y + distance_y < height and 0 <= x + distance_x < width:
+                    block.add((int(y + distance_y), int(x + distance_x)))
+
+    # Add or remove the nodes that crossed the tolerance
+    for cell in block:
+        passable = detection_map[cell] <= tolerance
+        if passable and cell not in graph:
+            graph.add_node(cell)
+            affected.add(cell)
+        elif not passable and cell in graph:
+            # Its successors lose it as predecessor
+            affected.update(graph.successors(cell))
+            graph.remove_node(cell)
+            affected.add(cell)
+
+    # Recompute the edges inside the block
+    for cell in block:
+        if cell not in graph:
+            continue
+        for distance_y, distance_x in offsets:
+            neighbour = (cell[0] + distance_y, cell[1] + distance_x)
+            if neighbour not in block:
+                continue
 
-    return total_cost
\ No newline at end of file
+            weight = _edge_weight(detection_map, tolerance, cell, neighbour)
+            current = graph[cell][neighbour]['weight'] if graph.has_edge(cell, neighbour) else None
+            if weight == current:
+                continue
+            if weight is None:
+                graph.remove_edge(cell, neighbour)
+            else:
+                graph.add_edge(cell, neighbour, weight=weight)
+            affected.add(neighbour)
+
+    return affected
+
+class LPAStar:
+    """
+    Lifelong Planning A* between two fixed nodes of a graph. After edge costs change, only the
+    nodes whose costs are affected are re-expanded, repairing the previous solution
+    """
+    def __init__(self, graph: nx.DiGraph, start: tuple, goal: tuple,
+                 heuristic_function, heuristic_scale: np.float32):
+        self.graph           = graph                # Graph searched (updated in place by the owner)
+        self.start           = start                # Start node of the leg
+        self.goal            = goal                 # Goal node of the leg
+        self.heuristic       = heuristic_function   # Heuristic (in number of cells) towards the goal
+        self.heuristic_scale = heuristic_scale      # Cheapest edge cost (keeps the heuristic consistent)
+        self.g               = {}                   # Cost of the best path found to each node
+        self.rhs             = {start: 0.0}         # One-step lookahead cost of each node
+        self.queue           = []                   # Priority queue of locally inconsistent nodes
+        self.queued          = {}                   # Valid key of each queued node (lazy deletion)
+
+        self._push(start)
+
+    def _h(self, node: tuple) -> np.float32:
+        return self.heuristic(node, self.goal) * self.heuristic_scale
+
+    def _key(self, node: tuple) -> tuple:
+        cost = min(self.g.get(node, np.inf), self.rhs.get(node, np.inf))
+        return (cost + self._h(node), cost)
+
+    def _push(self, node: tuple) -> None:
+        key = self._key(node)
+        self.queued[node] = key
+        heapq.heappush(self.queue, (key, node))
+
+    def _top_key(self) -> tuple:
+        """ Returns the smallest valid key of the queue (discarding outdated entries) """
+        while self.queue and self.queued.get(self.queue[0][1]) != self.queue[0][0]:
+            heapq.heappop(self.queue)
+        return self.queue[0][0] if self.queue else (np.inf, np.inf)
+
+    def update_vertex(self, node: tuple) -> None:
+        """ Recomputes the lookahead cost of a node and (re)queues it if it became inconsistent """
+        if node not in self.graph:
+            # Removed nodes simply stop existing for the search
+            self.g.pop(node, None)
+            self.rhs.pop(node, None)
+            self.queued.pop(node, None)
+            return
+
+        if node == self.start:
+            self.rhs[node] = 0.0
+        else:
+            self.rhs[node] = min((self.g.get(predecessor, np.inf) + weight
+                                  for predecessor, _, weight in self.graph.in_edges(node, data='weight')),
+                                 default=np.inf)
+
+        self.queued.pop(node, None)
+        if self.g.get(node, np.inf) != self.rhs.get(node, np.inf):
+            self._push(node)
+
+    def compute_shortest_path(self) -> int:
+        """ Expands the inconsistent nodes until the goal is consistent, returning the expansions """
+        expanded = 0
+        while (self._top_key() < self._key(self.goal) or
+               self.rhs.get(self.goal, np.inf) != self.g.get(self.goal, np.inf)):
+            if not self.queue:
+                break
+            _, node = heapq.heappop(self.queue)
+            del self.queued[node]
+            expanded += 1
+
+            if self.g.get(node, np.inf) > self.rhs[node]:
+                # Overconsistent: the node got cheaper
+                self.g[node] = self.rhs[node]
+            else:
+                # Underconsistent: the node got more expensive, recompute it and its successors
+                self.g[node] = np.inf
+                self.update_vertex(node)
+
+            for successor in self.graph.successors(node):
+                self.update_vertex(successor)
+
+        return expanded
+
+    def path(self) -> list:
+        """ Follows the cheapest predecessors back from the goal """
+        if self.g.get(self.goal, np.inf) == np.inf:
+            raise nx.NetworkXNoPath(f"No path between {self.start} and {self.goal}")
+
+        path = [self.goal]
+        while path[-1] != self.start:
+            node = path[-1]
+            path.append(min(self.graph.predecessors(node),
+                            key=lambda predecessor: self.g.get(predecessor, np.inf) + self.graph[predecessor][node]['weight']))
+            if len(path) > self.graph.number_of_nodes():
+                raise nx.NetworkXNoPath(f"Inconsistent search state between {self.start} and {self.goal}")
+
+        return path[::-1]
+
+class IncrementalPlanner:
+    """
+    Plans the visit of the POIs keeping an LPA* search per leg, so that after a change of the
+    detection map only the affected part of each leg is searched again
+    """
+    def __init__(self,
+                 detection_map:          np.array,
+                 tolerance:              np.float32,
+                 heuristic_function,
+                 locations:              np.array,
+                 initial_location_index: np.int32,
+                 boundaries:             Boundaries,
+                 map_width:              np.int32,
+                 map_height:             np.int32,
+                 connectivity:           int = 4):
+        self.detection_map = np.array(detection_map, copy=True)     # Detection map currently planned on
+        self.tolerance     = tolerance                              # Maximum detection level allowed
+        self.heuristic     = heuristic_function                     # Heuristic of the searches
+        self.boundaries    = boundaries                             # Boundaries of the map
+        self.map_width     = map_width                              # Number of columns of the map
+        self.map_height    = map_height                             # Number of rows of the map
+        self.graph         = build_graph(detection_map=self.detection_map, tolerance=tolerance,
+                                         connectivity=connectivity)
+
+        locations = _discretize_locations(locations, boundaries, map_width, map_height)
+        self.legs = [(locations[i], locations[i + 1])
+                     for i in range(initial_location_index, len(locations) - 1)]
+        self._reset_searches()
+
+    def _reset_searches(self) -> None:
+        """ Starts every leg search from scratch """
+        # Scaling the heuristic by the cheapest passable cell keeps it consistent, which LPA* needs
+        # to reuse its costs
+        passable = self.detection_map[self.detection_map <= self.tolerance]
+        self.cheapest_cell   = float(np.min(passable)) if passable.size else EPSILON
+        self.heuristic_scale = _heuristic_scale(self.graph, self.cheapest_cell)
+        self.searches = [LPAStar(self.graph, start, end, self.heuristic, self.heuristic_scale)
+                         for start, end in self.legs]
+
+    def plan(self) -> tuple:
+        """ Computes (or repairs) every leg, returning the solution plan and the number of expanded nodes """
+        solution_plan = []
+        total_nodes_expanded = 0
+
+        for search in self.searches:
+            for node in (search.start, search.goal):
+                if node not in self.graph:
+                    print(f"Warning: Target node {node} not in graph (possibly in no-fly zone)")
+                    raise RuntimeError("Pathfinding aborted due to invalid path segment")
+
+            total_nodes_expanded += search.compute_shortest_path()
+            try:
+                path = search.path()
+            except nx.NetworkXNoPath:
+                print(f"No valid path from {search.start} to {search.goal}")
+                raise RuntimeError("Pathfinding aborted due to invalid path segment")
+
+            solution_plan.append(_to_path_segment(path, self.boundaries, self.map_width, self.map_height))
+
+        return solution_plan, total_nodes_expanded
+
+    def update(self, detection_map: np.array, changed_cells: np.array = None) -> tuple:
+        """
+        Replans after the detection map changed (the changed cells are detected if not given),
+        returning the repaired solution plan and the number of nodes expanded to repair it
+        """
+        if changed_cells is None:
+            changed_cells = np.argwhere(detection_map != self.detection_map)
+
+        self.detection_map = np.array(detection_map, copy=True)
+        affected = update_graph(self.graph, self.detection_map, self.tolerance, changed_cells)
+
+        # A passable cell cheaper than the one the heuristic was scaled by would make the stored
+        # keys inconsistent (only the changed cells can be)
+        changed_cells = np.asarray(changed_cells, dtype=np.int64).reshape(-1, 2)
+        changed_levels = self.detection_map[changed_cells[:, 0], changed_cells[:, 1]]
+        changed_levels = changed_levels[changed_levels <= self.tolerance]
+        if changed_levels.size and np.min(changed_levels) < self.cheapest_cell:
+            self._reset_searches()
+        else:
+            for search in self.searches:
+                for node in affected:
+                    search.update_vertex(node)
+
+        return self.plan()
@@ -1,12 +1,150 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from concurrent.futures import ThreadPoolExecutor
 import sys, os, json
 from components.Map import Map
 from components.Boundaries import Boundaries
 from components.SearchEngine import build_graph, path_finding, compute_path_cost, h1, h2
+from components.Percolation import find_minimum_tolerance, round_up_tolerance
 
 DEBUG = 0
 
+# Headless rendering settings (figures are written to OUTPUT_DIR instead of shown when it is set)
+OUTPUT_DIR    = None
+OUTPUT_FORMAT = "png"
+FIGURE_SIZE   = (10, 10)
+FIGURE_DPI    = 100
+
+# Backend used before enabling the headless mode (restored by reset_headless_output)
+PREVIOUS_BACKEND = None
+
+# Background worker that renders the figures in headless mode (created on demand)
+RENDER_WORKER  = None
+RENDER_FUTURES = []
+
+
+def set_headless_output(output_dir: str, output_format: str = "png") -> None:
+    """
+    Enables the headless rendering mode (Agg backend, figures written to disk)
+    Arguments:
+        output_dir: Directory where the figures are stored
+        output_format: Image format of the figures ("png" or "svg")
+    """
+    global OUTPUT_DIR, OUTPUT_FORMAT, PREVIOUS_BACKEND
+
+    if output_format not in ("png", "svg"):
+        raise ValueError("Output format must be 'png' or 'svg'")
+
+    os.makedirs(output_dir, exist_ok=True)
+    if PREVIOUS_BACKEND is None:
+        PREVIOUS_BACKEND = plt.get_backend()
+    plt.switch_backend("Agg")
+    OUTPUT_DIR    = output_dir
+    OUTPUT_FORMAT = output_format
+
+def reset_headless_output() -> None:
+    """ Disables the headless rendering mode, waiting for the pending figures and restoring the backend """
+    global OUTPUT_DIR, OUTPUT_FORMAT, PREVIOUS_BACKEND
+
+    wait_for_renders()
+    if PREVIOUS_BACKEND is not None:
+        plt.switch_backend(PREVIOUS_BACKEND)
+    OUTPUT_DIR       = None
+    OUTPUT_FORMAT    = "png"
+    PREVIOUS_BACKEND = None
+
+def submit_render(plot_function, **kwargs) -> None:
+    """ Runs a plotting function in the background worker (headless mode) or right away (interactive mode) """
+    global RENDER_WORKER
+
+    if OUTPUT_DIR is None:
+        plot_function(**kwargs)
+        return
+
+    # A single worker keeps the figures ordered and off the planning thread
+    if RENDER_WORKER is None:
+        RENDER_WORKER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+    RENDER_FUTURES.append(RENDER_WORKER.submit(plot_function, **kwargs))
+
+def wait_for_renders() -> None:
+    """ Blocks until every submitted figure has been written (re-raising rendering errors) """
+    while RENDER_FUTURES:
+        RENDER_FUTURES.pop(0).result()
+
+def downsample_detection_map(detection_map: np.array,
+                             max_height: np.int32,
+                             max_width: np.int32) -> np.array:
+    """
+    Reduces the detection map to (at most) the given number of pixels, keeping the maximum
+    detection level of each block so that no detection field disappears from the figure
+    Arguments:
+        detection_map: 2D numpy array of detection probabilities
+        max_height: Maximum number of rows of the output
+        max_width: Maximum number of columns of the output
+    """
+    height, width = detection_map.shape
+    factor_y = int(np.ceil(height / max_height))
+    factor_x = int(np.ceil(width / max_width))
+
+    if factor_y <= 1 and factor_x <= 1:
+        return detection_map
+
+    # Pad the borders (repeating the edge values) so that the map splits into whole blocks
+    pad_y = (-height) % factor_y
+    pad_x = (-width) % factor_x
+    padded = np.pad(detection_map, ((0, pad_y), (0, pad_x)), mode='edge')
+
+    blocks = padded.reshape(padded.shape[0] // factor_y, factor_y,
+                            padded.shape[1] // factor_x, factor_x)
+    return blocks.max(axis=(1, 3))
+
+def _new_figure(title: str) -> tuple:
+    """ Creates a figure (detached from pyplot in headless mode, so it can be drawn off the main thread) """
+    if OUTPUT_DIR is not None:
+        figure = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    else:
+        figure = plt.figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    axes = figure.add_subplot()
+    axes.set_title(title)
+    return figure, axes
+
+def _finish_figure(figure, name: str) -> None:
+    """ Writes the figure to the output directory (headless mode) or shows it (interactive mode) """
+    figure.tight_layout()
+    if OUTPUT_DIR is not None:
+        figure.savefig(os.path.join(OUTPUT_DIR, f"{name}.{OUTPUT_FORMAT}"), format=OUTPUT_FORMAT)
+    elif not DEBUG:
+        plt.show()
+    else:
+        plt.close(figure)
+
+def _draw_detection_map(figure, axes, detection_map: np.array, boundaries: Boundaries,
+                        alpha: float, bicubic: bool) -> None:
+    """ Draws the (downsampled) detection map and its colorbar on the given axes """
+    # Set up geographic extent
+    extent = [boundaries.min_lon, boundaries.max_lon,
+              boundaries.min_lat, boundaries.max_lat]
+
+    # There is no point in rendering more cells than pixels in the output
+    pixels_x = int(FIGURE_SIZE[0] * FIGURE_DPI)
+    pixels_y = int(FIGURE_SIZE[1] * FIGURE_DPI)
+    image = downsample_detection_map(detection_map, pixels_y, pixels_x)
+
+    im = axes.imshow(image,
+                     extent=extent,
+                     origin='lower',
+                     cmap='RdYlGn_r',  # Red-Yellow-Green (reversed)
+                     vmin=0, vmax=1,
+                     alpha=alpha,
+                     interpolation='bicubic' if bicubic else None)
+
+    # Add colorbar and labels
+    cbar = figure.colorbar(im, ax=axes)
+    cbar.set_label('Detection Probability')
+
 
 def plot_radar_locations(boundaries: Boundaries,
                          radar_locations: np.array,
@@ -18,28 +156,25 @@ def plot_radar_locations(boundaries: Boundaries,
         radar_locations: Numpy array of (lat, lon) coordinates
         title: Optional plot title
     """
-    plt.figure(figsize=(10, 10))
-    plt.title(title)
+    figure, axes = _new_figure(title)
 
     # Plot map boundaries
-    plt.plot([boundaries.min_lon, boundaries.max_lon,
-                    boundaries.max_lon, boundaries.min_lon, boundaries.min_lon],
-                    [boundaries.max_lat, boundaries.max_lat, boundaries.min_lat,
-                    boundaries.min_lat, boundaries.max_lat],
-                    'k--', linewidth=1, label='Area Boundary')
+    axes.plot([boundaries.min_lon, boundaries.max_lon,
+               boundaries.max_lon, boundaries.min_lon, boundaries.min_lon],
+              [boundaries.max_lat, boundaries.max_lat, boundaries.min_lat,
+               boundaries.min_lat, boundaries.max_lat],
+              'k--', linewidth=1, label='Area Boundary')
 
     # Plot radars
-    plt.scatter(radar_locations[:, 1], radar_locations[:, 0],
-                c='red', marker='X', s=100, label='Radars', zorder=3)
+    axes.scatter(radar_locations[:, 1], radar_locations[:, 0],
+                 c='red', marker='X', s=100, label='Radars', zorder=3)
 
     # Style settings
-    plt.xlabel("Longitude")
-    plt.ylabel("Latitude")
-    plt.grid(True, alpha=0.8, lw=2, ls='--')
-    plt.legend(loc='upper right')
-    plt.tight_layout()
-    if not DEBUG:
-        plt.show()
+    axes.set_xlabel("Longitude")
+    axes.set_ylabel("Latitude")
+    axes.grid(True, alpha=0.8, lw=2, ls='--')
+    axes.legend(loc='upper right')
+    _finish_figure(figure, "radar_locations")
 
 def plot_detection_fields(detection_map: np.array,
                           boundaries: Boundaries,
@@ -53,38 +188,21 @@ def plot_detection_fields(detection_map: np.array,
         title: Optional plot title
         bicubic: Whether to use smooth interpolation
     """
-    plt.figure(figsize=(10, 10))
-    plt.title(title)
-
-    # Set up geographic extent
-    extent = [boundaries.min_lon, boundaries.max_lon,
-              boundaries.min_lat, boundaries.max_lat]
+    figure, axes = _new_figure(title)
 
     # Plot detection map
-    im = plt.imshow(detection_map,
-                    extent=extent,
-                    origin='lower',
-                    cmap='RdYlGn_r',  # Red-Yellow-Green (reversed)
-                    vmin=0, vmax=1,
-                    alpha=0.8,
-                    interpolation='bicubic' if bicubic else None)
-
-    # Add colorbar and labels
-    cbar = plt.colorbar(im)
-    cbar.set_label('Detection Probability')
-    plt.xlabel("Longitude")
-    plt.ylabel("Latitude")
-    plt.grid(True, alpha=0.8, lw=2, ls='--')
+    _draw_detection_map(figure, axes, detection_map, boundaries, alpha=0.8, bicubic=bicubic)
+    axes.set_xlabel("Longitude")
+    axes.set_ylabel("Latitude")
+    axes.grid(True, alpha=0.8, lw=2, ls='--')
     # Plot boundaries
-    plt.plot([boundaries.min_lon, boundaries.max_lon,
-              boundaries.max_lon, boundaries.min_lon, boundaries.min_lon],
-             [boundaries.max_lat, boundaries.max_lat, boundaries.min_lat,
-              boundaries.min_lat, boundaries.max_lat],
-             'k--', linewidth=1)
-
-    plt.tight_layout()
-    if not DEBUG:
-        plt.show()
+    axes.plot([boundaries.min_lon, boundaries.max_lon,
+               boundaries.max_lon, boundaries.min_lon, boundaries.min_lon],
+              [boundaries.max_lat, boundaries.max_lat, boundaries.min_lat,
+               boundaries.min_lat, boundaries.max_lat],
+              'k--', linewidth=1)
+
+    _finish_figure(figure, "detection_fields")
 
 def plot_solution(detection_map: np.array,
                   solution_plan: list,
@@ -98,56 +216,38 @@ def plot_solution(detection_map: np.array,
         boundaries: Boundaries object containing geographic limits
         bicubic: Whether to use bicubic interpolation for smoother visualization
     """
-    plt.figure(figsize=(10, 10))
-    plt.title("Optimal Path Through Radar Detection Field")
-
-    # Set up geographic extent
-    extent = [boundaries.min_lon, boundaries.max_lon,
-              boundaries.min_lat, boundaries.max_lat]
+    figure, axes = _new_figure("Optimal Path Through Radar Detection Field")
 
     # Plot detection map first
-    im = plt.imshow(detection_map,
-                    extent=extent,
-                    origin='lower',
-                    cmap='RdYlGn_r',  # Red-Yellow-Green (reversed)
-                    vmin=0, vmax=1,
-                    alpha=0.7,
-                    interpolation='bicubic' if bicubic else None)
-
-    # Plot each path segment
-    for segment in solution_plan:
-        if not segment:
-            continue
-
-        # Extract coordinates
-        lons = [point['geo'][1] for point in segment]
-        lats = [point['geo'][0] for point in segment]
-
-        # Plot path
-        plt.plot(lons, lats, 'b-', linewidth=2, zorder=3)
-
-        # Plot markers
-        plt.scatter(lons[0], lats[0], c='green', marker='o', s=100, zorder=4)
-        plt.scatter(lons[-1], lats[-1], c='red', marker='X', s=100, zorder=4)
+    _draw_detection_map(figure, axes, detection_map, boundaries, alpha=0.7, bicubic=bicubic)
 
-    # Add colorbar and labels
-    cbar = plt.colorbar(im)
-    cbar.set_label('Detection Probability')
-    plt.xlabel("Longitude")
-    plt.ylabel("Latitude")
-    plt.grid(True, alpha=0.8, lw=2, ls='--')
+    # Extract the (lon, lat) coordinates of every non-empty segment
+    segments = [np.array([(point['geo'][1], point['geo'][0]) for point in segment])
+                for segment in solution_plan if segment]
+
+    if segments:
+        # Plot all the path segments as a single collection
+        axes.add_collection(LineCollection(segments, colors='blue', linewidths=2, zorder=3))
+
+        # Plot the start and end markers of every segment at once
+        starts = np.array([segment[0] for segment in segments])
+        ends   = np.array([segment[-1] for segment in segments])
+        axes.scatter(starts[:, 0], starts[:, 1], c='green', marker='o', s=100, zorder=4)
+        axes.scatter(ends[:, 0], ends[:, 1], c='red', marker='X', s=100, zorder=4)
+
+    axes.set_xlabel("Longitude")
+    axes.set_ylabel("Latitude")
+    axes.grid(True, alpha=0.8, lw=2, ls='--')
 
     # Create custom legend
     legend_elements = [
-        plt.Line2D([0], [0], color='blue', lw=2, label='Flight Path'),
-        plt.scatter([], [], c='green', marker='o', s=100, label='Path Start'),
-        plt.scatter([], [], c='red', marker='X', s=100, label='Path End')
+        Line2D([0], [0], color='blue', lw=2, label='Flight Path'),
+        Line2D([0], [0], color='green', marker='o', markersize=10, ls='', label='Path Start'),
+        Line2D([0], [0], color='red', marker='X', markersize=10, ls='', label='Path End')
     ]
-    plt.legend(handles=legend_elements, loc='upper right')
+    axes.legend(handles=legend_elements, loc='upper right')
 
-    plt.tight_layout()
-    if not DEBUG:
-        plt.show()
+    _finish_figure(figure, "solution")
 
 def parse_args() -> dict:
     """ Parses the main arguments of the program and returns them stored in a dictionary """
@@ -166,13 +266,20 @@ def parse_args() -> dict:
 
     global DEBUG
 
-    # Add debug parameter to avoid plotting the graphs
-    try:
-        if sys.argv[3] == "-d":
-            DEBUG = 1
-    # If no debug mode, pass
-    except IndexError:
-        pass
+    # Optional flags: "-d" (debug, no plots) and "-o <dir> [svg]" (headless, figures written to <dir>)
+    options = sys.argv[3:]
+    if "-d" in options:
+        DEBUG = 1
+    if "-o" in options:
+        position = options.index("-o")
+        try:
+            output_dir = options[position + 1]
+        except IndexError:
+            raise ValueError("Missing output directory after '-o'")
+        output_format = "png"
+        if position + 2 < len(options) and options[position + 2] in ("png", "svg"):
+            output_format = options[position + 2]
+        set_headless_output(output_dir, output_format)
 
     # Depending on execution type, path can be different
     try:
@@ -238,13 +345,13 @@ def main() -> None:
     radar_locations = radar_map.get_radars_locations_numpy()
 
     # Plot the radar locations (latitude increments from bottom to top)
-    plot_radar_locations(boundaries=boundaries, radar_locations=radar_locations)
+    submit_render(plot_radar_locations, boundaries=boundaries, radar_locations=radar_locations)
 
     # Compute the detection map (sets the costs for each cell)
     detection_map = radar_map.compute_detection_map(use_cache=True)
 
     # Plot the detection map (detection fields)
-    plot_detection_fields(detection_map=detection_map, boundaries=boundaries)
+    submit_render(plot_detection_fields, detection_map=detection_map, boundaries=boundaries)
 
     # To clear old cache (e.g., >2 days old)
     radar_map.clear_cache(older_than_days=2)
@@ -271,10 +378,20 @@ def main() -> None:
     # In case of error, advise of the cause and solutions
     except RuntimeError as error:
         print(str(error))
+        minimum_tolerance = find_minimum_tolerance(detection_map=detection_map,
+                                                   locations=points_of_interest,
+                                                   boundaries=boundaries,
+                                                   map_width=radar_map.width,
+                                                   map_height=radar_map.height)
         print("Possible solutions:")
-        print("- Increase the tolerance value")
+        if np.isfinite(minimum_tolerance):
+            minimum_tolerance = round_up_tolerance(minimum_tolerance, decimals=6)
+            print(f"- Increase the tolerance value (all POIs are connected from {minimum_tolerance:.6f})")
+        else:
+            print("- Increase the tolerance value")
         print("- Adjust radar positions")
         print("- Modify POI locations")
+        wait_for_renders()
         raise RuntimeError(str(error))
 
     # Some verbose of the total cost and the number of expanded nodes
@@ -282,7 +399,10 @@ def main() -> None:
     print(f"Number of expanded nodes: {nodes_expanded}")
 
     # Plot the solution
-    plot_solution(detection_map=detection_map, boundaries=boundaries, solution_plan=solution_plan)
+    submit_render(plot_solution, detection_map=detection_map, boundaries=boundaries, solution_plan=solution_plan)
+
+    # Make sure every figure has been written before finishing
+    wait_for_renders()
 
     # Get cache size
     print(f"Cache size: {radar_map.get_cache_size()/1024:.2f} KB")
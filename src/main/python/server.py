@@ -0,0 +1,282 @@
+""" Long-running local planning service that keeps detection maps and graphs warm in memory """
+import asyncio
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from components.Map import Map
+from components.Boundaries import Boundaries
+from components.LRUCache import LRUCache
+from components.SearchEngine import build_graph, path_finding, compute_path_cost, h1, h2
+from main import retrieve_file_info
+
+
+# Default location of the scenarios file (next to the components)
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "scenarios.json")
+
+# Heuristics that can be requested by name
+HEURISTICS = {"h1": h1, "h2": h2}
+
+# HTTP status (and reason) returned for each kind of planning error
+ERROR_STATUS = {
+    KeyError:     (404, "Not Found"),
+    ValueError:   (400, "Bad Request"),
+    TypeError:    (400, "Bad Request"),
+    RuntimeError: (422, "Unprocessable Entity"),
+}
+
+# Warm state of a worker process: scenarios -> (parameters, boundaries, map, detection map) and
+# (scenario, tolerance) -> directed graph (set up by _init_worker)
+WORKER_STATE = None
+
+
+def _init_worker(scenarios_path: str, max_scenarios: int, max_graphs: int) -> None:
+    """ Sets up the caches of a worker process """
+    global WORKER_STATE
+    WORKER_STATE = {
+        "scenarios_path": scenarios_path,
+        "scenarios":      LRUCache(max_scenarios),
+        "graphs":         LRUCache(max_graphs),
+    }
+
+def _load_scenario(scenarios_path: str, scenario: str) -> tuple:
+    """ Loads a scenario, generates its radars and computes its detection map (blocking) """
+    with open(scenarios_path, 'r', encoding='utf-8') as file:
+        execution_parameters = retrieve_file_info({}, file, scenario)
+
+    boundaries = Boundaries(max_lat=execution_parameters['max_lat'],
+                            min_lat=execution_parameters['min_lat'],
+                            max_lon=execution_parameters['max_lon'],
+                            min_lon=execution_parameters['min_lon'])
+    radar_map = Map(boundaries=boundaries,
+                    height=execution_parameters['H'],
+                    width=execution_parameters['W'])
+
+    # Same radars as the command line execution of the scenario (each worker process has its own
+    # global generator, and runs one query at a time)
+    np.random.seed(42)
+    radar_map.generate_radars(n_radars=execution_parameters['n_radars'])
+
+    detection_map = radar_map.compute_detection_map(use_cache=True)
+    return execution_parameters, boundaries, radar_map, detection_map
+
+def _plan_in_worker(scenario: str, tolerance: float, heuristic: str, pois: list) -> dict:
+    """ Computes the solution plan of a query in a worker process, keeping its map and graph warm """
+    scenarios, graphs = WORKER_STATE["scenarios"], WORKER_STATE["graphs"]
+
+    loaded = scenarios.get(scenario)
+    if loaded is None:
+        loaded = _load_scenario(WORKER_STATE["scenarios_path"], scenario)
+        scenarios.put(scenario, loaded)
+    execution_parameters, boundaries, radar_map, detection_map = loaded
+
+    graph = graphs.get((scenario, tolerance))
+    if graph is None:
+        graph = build_graph(detection_map, tolerance)
+        graphs.put((scenario, tolerance), graph)
+
+    locations = np.array(pois if pois is not None else execution_parameters['POIs'], dtype=np.float32)
+    solution_plan, nodes_expanded = path_finding(graph=graph,
+                                                 heuristic_function=HEURISTICS[heuristic],
+                                                 locations=locations,
+                                                 initial_location_index=0,
+                                                 boundaries=boundaries,
+                                                 map_width=radar_map.width,
+                                                 map_height=radar_map.height)
+    path_cost = compute_path_cost(graph=graph, solution_plan=solution_plan)
+
+    return {
+        "path_cost":      float(path_cost),
+        "nodes_expanded": int(nodes_expanded),
+        "solution_plan":  [[{"grid": list(point['grid']), "geo": list(point['geo'])}
+                            for point in segment] for segment in solution_plan],
+    }
+
+
+class PlanningServer:
+    """
+    Class that models the planning service (HTTP over TCP or over a Unix socket). The searches run
+    in worker processes (so queries on different scenarios are answered in parallel), and each
+    scenario is always sent to the same worker, which keeps its detection map and graphs warm
+    """
+    def __init__(self,
+                 scenarios_path: str = SCENARIOS_PATH,
+                 max_scenarios:  int = 4,
+                 max_graphs:     int = 8,
+                 workers:        int = 4):
+        self.scenarios_path = scenarios_path                # Path to the scenarios JSON file
+        self.scenarios      = LRUCache(max_scenarios)       # Recently planned scenarios -> worker index
+        self.graphs         = LRUCache(max_graphs)          # Recently planned (scenario, tolerance) -> worker index
+        self.workers        = [ProcessPoolExecutor(max_workers=1,
+                                                   mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_worker,
+                                                   initargs=(scenarios_path, max_scenarios, max_graphs))
+                               for _ in range(workers)]     # Worker processes (one queue each)
+        self.inflight       = {}                            # Key -> future of the identical request being computed
+        self.searches_run   = 0                             # Number of searches actually executed
+        self.loop           = None                          # Event loop (when served from a background thread)
+        self.server         = None                          # asyncio server object
+
+    def _worker_index(self, scenario: str) -> int:
+        """ Returns the worker in charge of a scenario (always the same one) """
+        return zlib.crc32(scenario.encode('utf-8')) % len(self.workers)
+
+    async def _batched(self, key: tuple, executor, function, *args):
+        """ Runs a blocking function in a worker, sharing the result among identical concurrent requests """
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(executor, function, *args)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # Shielded so that a client disconnecting does not cancel the work shared with others
+        return await asyncio.shield(future)
+
+    async def plan(self, request: dict) -> dict:
+        """ Answers a path query: {"scenario", "tolerance", ["heuristic"], ["POIs"]} """
+        scenario  = request.get("scenario")
+        tolerance = request.get("tolerance")
+        if scenario is None:
+            raise ValueError("Missing required scenario argument")
+        if tolerance is None:
+            raise ValueError("Missing required tolerance argument")
+        if isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)):
+            raise TypeError("Tolerance must be numeric")
+        tolerance = float(tolerance)
+
+        heuristic = request.get("heuristic", "h2")
+        if heuristic not in HEURISTICS:
+            raise ValueError(f"Unknown heuristic '{heuristic}'")
+
+        pois = request.get("POIs")
+        if pois is not None:
+            try:
+                pois = np.array(pois, dtype=np.float32).tolist()
+            except ValueError:
+                raise ValueError("Invalid POI coordinates")
+
+        key = ("plan", scenario, tolerance, heuristic, json.dumps(pois))
+        if key not in self.inflight:
+            self.searches_run += 1
+
+        index = self._worker_index(scenario)
+        result = await self._batched(key, self.workers[index], _plan_in_worker,
+                                     scenario, tolerance, heuristic, pois)
+
+        self.scenarios.put(scenario, index)
+        self.graphs.put((scenario, tolerance), index)
+        return dict(result, scenario=scenario, tolerance=tolerance)
+
+    def health(self) -> dict:
+        """ Reports the recently planned (warm) scenarios and graphs """
+        return {
+            "status":       "ok",
+            "scenarios":    self.scenarios.keys(),
+            "graphs":       [list(key) for key in self.graphs.keys()],
+            "searches_run": self.searches_run,
+        }
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> tuple:
+        """ Routes a request and returns its (status, reason, payload) """
+        if method == "GET" and target == "/health":
+            return 200, "OK", self.health()
+
+        if method == "POST" and target == "/plan":
+            try:
+                return 200, "OK", await self.plan(json.loads(body or b"{}"))
+            except tuple(ERROR_STATUS) as error:
+                status, reason = next(ERROR_STATUS[kind] for kind in ERROR_STATUS if isinstance(error, kind))
+                message = error.args[0] if error.args else str(error)
+                return status, reason, {"error": str(message), "type": type(error).__name__}
+
+        return 404, "Not Found", {"error": f"No route for {method} {target}", "type": "KeyError"}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ Serves a single HTTP/1.1 request of a connection """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode('latin-1').split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, reason, payload = await self._dispatch(request_line[0], request_line[1], body)
+
+        except Exception as error:
+            status, reason, payload = 500, "Internal Server Error", {"error": str(error), "type": "RuntimeError"}
+
+        data = json.dumps(payload).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {reason}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(data)}\r\n"
+                      f"Connection: close\r\n\r\n").encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix_path: str = None):
+        """ Starts listening on a TCP port or, if given, on a Unix socket """
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle_connection, host=host, port=port)
+        return self.server
+
+    def serve_in_thread(self, host: str = "127.0.0.1", port: int = 0, unix_path: str = None):
+        """ Runs the service in a daemon thread and returns the bound address (used by tests and scripts) """
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start(host, port, unix_path))
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="planning-server", daemon=True).start()
+        started.wait()
+        return unix_path if unix_path is not None else self.server.sockets[0].getsockname()[:2]
+
+    def shutdown(self) -> None:
+        """ Stops a service started with serve_in_thread and its worker processes """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        for worker in self.workers:
+            worker.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve_forever(server: PlanningServer, host: str, port: int, unix_path: str) -> None:
+    """ Starts the service and serves requests until interrupted """
+    async with await server.start(host, port, unix_path) as listener:
+        print(f"Planning service listening on {unix_path or f'{host}:{port}'}")
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local radar path planning service")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix", default=None, help="Unix socket path (instead of TCP)")
+    parser.add_argument("--max-scenarios", type=int, default=4, help="Warm detection maps kept in memory")
+    parser.add_argument("--max-graphs", type=int, default=8, help="Warm graphs kept in memory")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    arguments = parser.parse_args()
+
+    planning_server = PlanningServer(max_scenarios=arguments.max_scenarios,
+                                     max_graphs=arguments.max_graphs,
+                                     workers=arguments.workers)
+    try:
+        asyncio.run(serve_forever(planning_server, arguments.host, arguments.port, arguments.unix))
+    except KeyboardInterrupt:
+        pass
@@ -1,12 +1,21 @@
 """Contains the test cases execution of the radar pathfinder"""
-import os, unittest, json, sys
+import os, unittest, json, sys, tempfile, io, contextlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import networkx as nx
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../main/python")))
+import main as main_module
 from main import main
 from components.Map import Map, Boundaries
-from components.SearchEngine import path_finding, build_graph, h1
+from components.SearchEngine import path_finding, build_graph, compute_path_cost, h1, h2
+from components.SearchEngine import IncrementalPlanner, line_of_sight_cost, anytime_path_finding
+from components.SearchEngine import corridor_path_finding
+from components.RadarSchedule import RadarSchedule
+from components.Percolation import find_minimum_tolerance, tolerance_coverage, round_up_tolerance
+from server import PlanningServer
+from client import PlanningClient
 
 class TestRadarPathfinder(unittest.TestCase):
     """ Class for testing the Radar Pathfinder system """
@@ -67,6 +76,337 @@ class TestRadarPathfinder(unittest.TestCase):
                          map_height=16)
             self.assertIn("Pathfinding aborted due to invalid path segment", str(context.exception))
 
+    def test_headless_rendering(self):
+        """ Headless mode writes downsampled figures to disk from the background worker """
+        self.addCleanup(main_module.reset_headless_output)
+        previous_backend = main_module.plt.get_backend()
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        detection_map = np.random.default_rng(0).random((2500, 2500)).astype(np.float32)
+        solution_plan = [[{'grid': (0, 0), 'geo': (36.0, -116.0)},
+                          {'grid': (5, 5), 'geo': (36.5, -115.5)}]]
+
+        reduced = main_module.downsample_detection_map(detection_map, 1000, 1000)
+        self.assertEqual(reduced.shape, (834, 834))
+        self.assertEqual(reduced.max(), detection_map.max())
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            main_module.set_headless_output(output_dir, "svg")
+            main_module.submit_render(main_module.plot_solution, detection_map=detection_map,
+                                      solution_plan=solution_plan, boundaries=bounds)
+            main_module.wait_for_renders()
+            self.assertTrue(os.path.exists(os.path.join(output_dir, "solution.svg")))
+
+        main_module.reset_headless_output()
+        self.assertIsNone(main_module.OUTPUT_DIR)
+        self.assertEqual(main_module.OUTPUT_FORMAT, "png")
+        self.assertEqual(main_module.plt.get_backend(), previous_backend)
+
+    def test_planning_service(self):
+        """ The local service answers (concurrent) path queries and keeps the scenario warm """
+        server = PlanningServer(max_scenarios=2, max_graphs=2, workers=2)
+        host, port = server.serve_in_thread()
+        self.addCleanup(server.shutdown)
+        client = PlanningClient(host=host, port=port)
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda _: client.plan("scenario_4", 0.5), range(3)))
+
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertGreater(results[0]["nodes_expanded"], 0)
+        self.assertEqual(client.health()["scenarios"], ["scenario_4"])
+        # The three identical requests share a single search, later ones search again
+        self.assertEqual(client.health()["searches_run"], 1)
+        self.assertEqual(client.plan("scenario_4", 0.5), results[0])
+        self.assertEqual(client.health()["searches_run"], 2)
+
+        # Queries on scenarios of different workers run in parallel processes
+        self.assertNotEqual(server._worker_index("scenario_2"), server._worker_index("scenario_4"))
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda scenario: client.plan(scenario, 0.5), ["scenario_2", "scenario_4"]))
+        self.assertEqual(results[1], client.plan("scenario_4", 0.5))
+        self.assertEqual(sorted(client.health()["scenarios"]), ["scenario_2", "scenario_4"])
+
+        with self.assertRaises(KeyError):
+            client.plan("scenario_99", 0.5)
+        with self.assertRaises(ValueError):
+            client.plan("scenario_4", 1.1)
+
+    def test_bulk_radar_generation(self):
+        """ Radar fleets are drawn at once, reproducibly, even beyond the grid dimensions """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        first_map, second_map = Map(bounds, 16, 16), Map(bounds, 16, 16)
+        first_map.generate_radars(100000, seed=7)
+        second_map.generate_radars(100000, seed=7)
+
+        self.assertEqual(len(first_map.radars), 100000)
+        np.testing.assert_array_equal(first_map.get_radars_locations_numpy(),
+                                      second_map.get_radars_locations_numpy())
+        np.testing.assert_array_equal(first_map.radars.covariance, second_map.radars.covariance)
+        self.assertAlmostEqual(first_map.radars[3].compute_max_range(),
+                               first_map.radars.compute_max_range()[3])
+
+        # Without a seed, the global generator draws the same radars as the original implementation
+        np.random.seed(42)
+        first_map.generate_radars(3)
+        np.testing.assert_allclose(first_map.radars.latitudes, [36.0, 36.0666667, 36.3333333])
+        np.testing.assert_allclose(first_map.radars.transmission_power,
+                                   [524775.1354837288, 466763.4264850867, 304614.4645596015])
+        np.testing.assert_array_equal(first_map.radars.total_loss, [3, 9, 8])
+        self.assertAlmostEqual(first_map.radars.covariance[2, 0, 0], 2.6189933800739312e-05)
+
+    def test_radar_inventories(self):
+        """ Radar inventories round-trip through .npz (memory mapped) and chunked .csv files """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        source_map, loaded_map = Map(bounds, 16, 16), Map(bounds, 16, 16)
+        source_map.generate_radars(1000, seed=3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("inventory.npz", "inventory.csv"):
+                path = os.path.join(directory, name)
+                source_map.save_radars(path)
+                loaded_map.load_radars(path)
+                for field in ("latitudes", "transmission_power", "total_loss", "covariance"):
+                    np.testing.assert_array_equal(getattr(loaded_map.radars, field),
+                                                  getattr(source_map.radars, field))
+                if name.endswith(".npz"):
+                    self.assertIsInstance(loaded_map.radars.latitudes, np.memmap)
+
+            # Fleets that only differ in their covariance matrices do not share cached detection maps
+            self.assertEqual(loaded_map._generate_cache_key(), source_map._generate_cache_key())
+            loaded_map.radars.covariance = loaded_map.radars.covariance * 5
+            self.assertNotEqual(loaded_map._generate_cache_key(), source_map._generate_cache_key())
+
+            path = os.path.join(directory, "invalid.csv")
+            source_map.radars.transmission_power[[5, 9]] = -1.0
+            source_map.save_radars(path)
+            with self.assertRaises(ValueError) as context:
+                Map(bounds, 16, 16).load_radars(path)
+            self.assertIn("2 with invalid transmission power (first at index 5)", str(context.exception))
+
+    def test_incremental_replanning(self):
+        """ Replanning after a local change of the map repairs the optimal plan with fewer expansions """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        points_of_interest = np.array([[36.0, -116.0], [37.0, -115.0]], dtype=np.float32)
+        for connectivity in (4, 8):
+            with self.subTest(connectivity=connectivity):
+                detection_map = np.random.default_rng(1).uniform(1e-4, 1.0, (40, 40)).astype(np.float32)
+                planner = IncrementalPlanner(detection_map, 0.8, h2, points_of_interest, 0, bounds, 40, 40,
+                                             connectivity=connectivity)
+                _, initial_expansions = planner.plan()
+
+                # Block the middle of the current solution
+                solution_plan, _ = planner.plan()
+                y, x = solution_plan[0][len(solution_plan[0]) // 2]['grid']
+                detection_map[y - 1:y + 2, x - 1:x + 2] = 0.9
+                solution_plan, repair_expansions = planner.update(detection_map)
+
+                expected_graph = build_graph(detection_map=detection_map, tolerance=0.8, connectivity=connectivity)
+                self.assertEqual(planner.graph.adj, expected_graph.adj)
+                self.assertAlmostEqual(compute_path_cost(planner.graph, solution_plan),
+                                       nx.dijkstra_path_length(expected_graph, (0, 0), (39, 39)), places=3)
+                self.assertLess(repair_expansions, initial_expansions)
+
+        # The heuristic is scaled by the cheapest passable cell, so it guides the initial search
+        detection_map = np.random.default_rng(1).uniform(0.2, 1.0, (40, 40)).astype(np.float32)
+        planner = IncrementalPlanner(detection_map, 0.8, h2, points_of_interest, 0, bounds, 40, 40)
+        self.assertEqual(planner.heuristic_scale, float(np.min(detection_map)))
+        solution_plan, expansions = planner.plan()
+        dijkstra_planner = IncrementalPlanner(detection_map, 0.8, lambda node, goal: 0.0,
+                                              points_of_interest, 0, bounds, 40, 40)
+        self.assertLess(expansions, dijkstra_planner.plan()[1])
+
+        # A cheaper cell restarts the searches with a smaller scale (keeping the plan optimal)
+        detection_map[20, 20] = 0.1
+        solution_plan, _ = planner.update(detection_map)
+        self.assertAlmostEqual(planner.heuristic_scale, 0.1)
+        expected_graph = build_graph(detection_map=detection_map, tolerance=0.8)
+        self.assertAlmostEqual(compute_path_cost(planner.graph, solution_plan),
+                               nx.dijkstra_path_length(expected_graph, (0, 0), (39, 39)), places=3)
+
+    def test_detection_epochs(self):
+        """ Scheduled radars produce lazily computed, cached detection layers per epoch """
+        bounds = Boundaries(37.29139325161781, 37.21979775354181, -115.78524417824534, -115.8885843284312)
+        test_map = Map(bounds, 32, 32)
+        test_map.generate_radars(8, seed=4)
+        detection_map = test_map.compute_detection_map(use_cache=False)
+
+        test_map.radars.set_schedule(0, RadarSchedule(period=60, active_windows=[(0, 30)]))
+        test_map.radars.set_schedule(1, RadarSchedule(rotation_period=40, beam_width=np.pi / 2))
+        epochs = test_map.compute_detection_epochs(times=np.arange(0, 240, 20.0), cache_size=4)
+
+        # Radar 0 on, radar 1 pointing north
+        np.testing.assert_array_less(epochs[0], detection_map + 1e-6)
+        # Epochs 0 and 6 share the same active radars and headings (a single layer)
+        self.assertIs(epochs[0], epochs[6])
+        self.assertFalse(np.array_equal(epochs[0], epochs[2]))
+        self.assertLessEqual(len(epochs.layers), 4)
+
+        test_map.radars.set_schedule(1, None)
+        np.testing.assert_allclose(test_map.compute_detection_epochs(times=[0.0])[0], detection_map, atol=1e-6)
+
+    def test_geodesic_distance_modes(self):
+        """ The vectorized detection kernel matches the per-point model in every distance mode """
+        bounds = Boundaries(70.3, 69.9, 20.4, 19.6)
+        for distance_mode in ("euclidean", "equirectangular", "haversine"):
+            with self.subTest(distance_mode=distance_mode):
+                test_map = Map(bounds, 24, 24, distance_mode=distance_mode)
+                test_map.generate_radars(6, seed=5)
+                radar = test_map.radars[0]
+                lat_points = np.linspace(bounds.min_lat, bounds.max_lat, 24)
+                lon_points = np.linspace(bounds.min_lon, bounds.max_lon, 24)
+
+                field = radar.compute_detection_field(lat_points, lon_points, distance_mode)
+                expected = [[radar.compute_detection_level(lat, lon, distance_mode) for lon in lon_points]
+                            for lat in lat_points]
+                np.testing.assert_allclose(field, expected, rtol=1e-9)
+
+        # One degree of longitude at 60 degrees of latitude is about half of the flat approximation
+        radar.location.latitude = 60.0
+        self.assertAlmostEqual(radar.compute_distance(60.0, radar.location.longitude + 1.0, "haversine"),
+                               55597, delta=50)
+        self.assertAlmostEqual(radar.compute_distance(60.0, radar.location.longitude + 1.0, "euclidean"),
+                               111000, delta=1)
+        with self.assertRaises(ValueError):
+            Map(bounds, 24, 24, distance_mode="manhattan")
+
+    def test_any_angle_search(self):
+        """ 8-connected graphs and Theta* produce shorter paths, costed consistently """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        detection_map = np.full((30, 30), 0.1, dtype=np.float32)
+        detection_map[10:20, 12:18] = 0.9       # Obstacle in the middle of the map
+        points_of_interest = np.array([[36.0, -116.0], [37.0, -115.0]], dtype=np.float32)
+
+        costs = {}
+        for connectivity, search_mode in ((4, "astar"), (8, "astar"), (8, "theta_star")):
+            graph = build_graph(detection_map=detection_map, tolerance=0.5, connectivity=connectivity)
+            solution_plan, _ = path_finding(graph, h1, points_of_interest, 0, bounds, 30, 30,
+                                            search_mode=search_mode)
+            costs[(connectivity, search_mode)] = compute_path_cost(graph, solution_plan)
+
+        self.assertLess(costs[(8, "astar")], costs[(4, "astar")])
+        self.assertLessEqual(costs[(8, "theta_star")], costs[(8, "astar")])
+        self.assertLess(len(solution_plan[0]), 5)
+        for start, end in zip(solution_plan[0], solution_plan[0][1:]):
+            self.assertIsNotNone(line_of_sight_cost(detection_map, 0.5, start['grid'], end['grid']))
+
+        # No diagonal edge cuts the corner of the obstacle
+        graph = build_graph(detection_map=detection_map, tolerance=0.5, connectivity=8)
+        self.assertFalse(graph.has_edge((9, 12), (10, 11)))
+        self.assertTrue(graph.has_edge((9, 11), (10, 10)))
+
+        # Changing the map afterwards does not change the costs evaluated with the graph
+        theta_cost = costs[(8, "theta_star")]
+        graph = build_graph(detection_map=detection_map, tolerance=0.5, connectivity=8)
+        detection_map[:] = 0.4
+        self.assertAlmostEqual(compute_path_cost(graph, solution_plan), theta_cost, places=6)
+        self.assertFalse(graph.graph['detection_map'].flags.writeable)
+
+    def test_minimum_tolerance(self):
+        """ The percolation threshold is the smallest tolerance that connects every pair of POIs """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        detection_map = np.random.default_rng(2).uniform(1e-4, 1.0, (25, 25)).astype(np.float32)
+        points_of_interest = np.array([[36.0, -116.0], [36.5, -115.5], [37.0, -115.0]], dtype=np.float32)
+
+        tolerance = find_minimum_tolerance(detection_map, points_of_interest, bounds, 25, 25)
+        graph = build_graph(detection_map=detection_map, tolerance=float(tolerance))
+        path_finding(graph, h1, points_of_interest, 0, bounds, 25, 25)
+
+        below = float(np.max(detection_map[detection_map < tolerance]))
+        with self.assertRaises(RuntimeError):
+            path_finding(build_graph(detection_map=detection_map, tolerance=below),
+                         h1, points_of_interest, 0, bounds, 25, 25)
+
+        np.testing.assert_allclose(tolerance_coverage(detection_map, [0.0, tolerance, 1.0]),
+                                   [0.0, np.mean(detection_map <= tolerance), 1.0])
+
+        # The suggested (printed) tolerance is rounded up, and never below the lower limit
+        suggested = float(f"{round_up_tolerance(tolerance):.6f}")
+        self.assertGreaterEqual(suggested, tolerance)
+        path_finding(build_graph(detection_map=detection_map, tolerance=suggested),
+                     h1, points_of_interest, 0, bounds, 25, 25)
+        self.assertEqual(round_up_tolerance(0.2886041), 0.288605)
+        self.assertEqual(f"{round_up_tolerance(1e-6):.6f}", "0.000101")
+
+    def test_corridor_search_dense_map(self):
+        """ On a map covered by the radars, corridor maps keep the scale (and passable cells) of the full map """
+        bounds = Boundaries(37.29139325161781, 37.21979775354181, -115.78524417824534, -115.8885843284312)
+        corridor_map = Map(bounds, 256, 256)
+        corridor_map.generate_radars(32, seed=8)
+        regions = [(0, 256, 0, 256), (40, 120, 10, 200)]
+        detection_map = corridor_map.compute_detection_map(regions=regions[1:])
+
+        full_map = Map(bounds, 256, 256, radars=corridor_map.radars).compute_detection_map(use_cache=False)
+        np.testing.assert_array_equal(detection_map[40:120, 10:200], full_map[40:120, 10:200])
+        np.testing.assert_array_equal(corridor_map.compute_detection_map(regions=regions[:1]), full_map)
+
+    def test_anytime_search(self):
+        """ The anytime search returns a bounded suboptimal plan at once and the optimal one with time """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        detection_map = np.random.default_rng(3).uniform(1e-4, 1.0, (40, 40)).astype(np.float32)
+        points_of_interest = np.array([[36.0, -116.0], [37.0, -115.0]], dtype=np.float32)
+        graph = build_graph(detection_map=detection_map, tolerance=0.9)
+        optimal_cost = nx.dijkstra_path_length(graph, (0, 0), (39, 39))
+
+        quick_plan, quick_expansions, quick_stats = anytime_path_finding(
+            graph, h1, points_of_interest, 0, bounds, 40, 40, time_budget=0.0)
+        self.assertEqual(quick_stats['legs'][0]['iterations'], 1)
+        self.assertLessEqual(compute_path_cost(graph, quick_plan), quick_stats['bound'] * optimal_cost + 1e-6)
+
+        final_plan, final_expansions, final_stats = anytime_path_finding(
+            graph, h1, points_of_interest, 0, bounds, 40, 40, time_budget=30.0)
+        self.assertEqual(final_stats['bound'], 1.0)
+        self.assertAlmostEqual(compute_path_cost(graph, final_plan), optimal_cost, places=4)
+        self.assertLess(quick_expansions, final_expansions)
+
+    def test_anytime_search_diagonal_bound(self):
+        """ The bound of the anytime search holds with the Manhattan heuristic on 8-connected graphs """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        points_of_interest = np.array([[36.0, -116.0], [37.0, -115.0]], dtype=np.float32)
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                rng = np.random.default_rng(seed)
+                detection_map = rng.uniform(0.1, 0.12, (40, 40)).astype(np.float32)
+                detection_map[rng.random((40, 40)) < 0.2] = 1.0
+                detection_map[0, 0] = detection_map[39, 39] = 0.1
+                graph = build_graph(detection_map=detection_map, tolerance=0.9, connectivity=8)
+                optimal_cost = nx.dijkstra_path_length(graph, (0, 0), (39, 39))
+
+                plan, _, stats = anytime_path_finding(graph, h2, points_of_interest, 0, bounds, 40, 40,
+                                                      time_budget=30.0)
+                self.assertLessEqual(compute_path_cost(graph, plan), stats['bound'] * optimal_cost + 1e-6)
+
+    def test_corridor_search(self):
+        """ The corridor map matches the full map inside it, and is widened when it blocks the path """
+        bounds = Boundaries(37.0, 36.0, -115.0, -116.0)
+        test_map = Map(bounds, 40, 40)
+        test_map.generate_radars(30, seed=3)
+        full_map = test_map.compute_detection_map(use_cache=False)
+
+        corridor_map = test_map.compute_detection_map(use_cache=False, regions=[(10, 30, 5, 35)])
+        np.testing.assert_allclose(corridor_map[10:30, 5:35], full_map[10:30, 5:35], rtol=1e-6)
+        self.assertTrue(np.all(np.isinf(corridor_map[:10])))
+
+        # A corridor of a single row is blocked at this tolerance, so it has to be widened
+        points_of_interest = np.array([[36.5, -116.0], [36.5, -115.0]], dtype=np.float32)
+        solution_plan, _, graph = corridor_path_finding(test_map, 0.01, h1, points_of_interest, margin=0)
+        full_graph = build_graph(detection_map=full_map, tolerance=0.01)
+        full_plan, _ = path_finding(full_graph, h1, points_of_interest, 0, bounds, 40, 40)
+        self.assertLess(graph.number_of_nodes(), full_graph.number_of_nodes())
+        self.assertAlmostEqual(compute_path_cost(graph, solution_plan),
+                               compute_path_cost(full_graph, full_plan), places=6)
+
+        # A POI above the tolerance fails without widening the corridor, and corridors are not cached
+        blocked_y, blocked_x = np.argwhere(full_map > 0.01)[0]
+        points_of_interest[1] = [bounds.min_lat + (blocked_y + 0.5) / 39 * (bounds.max_lat - bounds.min_lat),
+                                 bounds.min_lon + (blocked_x + 0.5) / 39 * (bounds.max_lon - bounds.min_lon)]
+        cached_maps = set(os.listdir(test_map.cache_dir))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(RuntimeError):
+            corridor_path_finding(test_map, 0.01, h1, points_of_interest, margin=0)
+        self.assertIn(f"({blocked_y}, {blocked_x}) not in graph", output.getvalue())
+        self.assertNotIn("expanding its margin", output.getvalue())
+        self.assertEqual(set(os.listdir(test_map.cache_dir)), cached_maps)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file